@@ -0,0 +1,211 @@
+import configparser
+import json
+import secrets
+import threading
+
+from backend.pdf_utils.send_mail import CONFIG_PATH, ensure_config
+
+
+# Admission control for the submission endpoint.
+# Starlette's threadpool is the only other limit, so without this a burst of
+# large uploads keeps every payload (and its ReportLab canvas) in memory at once.
+
+
+def read_limits():
+    try:
+        ensure_config()
+    except RuntimeError as e:
+        print(e)
+
+    cfg = configparser.ConfigParser()
+    cfg.read(CONFIG_PATH, encoding="utf-8")
+
+    return {
+        "max_inflight_renders": max(1, cfg.getint("limits", "max_inflight_renders", fallback=4)),
+        "max_inflight_mb": max(1, cfg.getint("limits", "max_inflight_mb", fallback=64)),
+        "retry_after": max(1, cfg.getint("limits", "retry_after", fallback=5)),
+        "preview_cache_mb": max(1, cfg.getint("limits", "preview_cache_mb", fallback=32)),
+        "render_cache_mb": max(0, cfg.getint("limits", "render_cache_mb", fallback=256)),
+        "max_payload_mb": max(1, cfg.getint("limits", "max_payload_mb", fallback=25)),
+        "max_image_mb": max(1, cfg.getint("limits", "max_image_mb", fallback=10)),
+        "max_image_megapixels": max(1, cfg.getint("limits", "max_image_megapixels", fallback=40)),
+    }
+
+
+class AdmissionController:
+    """
+    Counts in-flight renders and in-flight payload bytes.
+    A request is admitted only if both stay under their limits.
+    """
+
+    def __init__(self, max_renders: int, max_bytes: int, retry_after: int):
+        self.max_renders = max_renders
+        self.max_bytes = max_bytes
+        self.retry_after = retry_after
+
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.in_flight_bytes = 0
+        self.peak_in_flight = 0
+        self.admitted = 0
+        self.rejected = {"renders": 0, "bytes": 0, "too_large": 0}
+
+    @classmethod
+    def from_config(cls):
+        limits = read_limits()
+        return cls(
+            max_renders=limits["max_inflight_renders"],
+            max_bytes=limits["max_inflight_mb"] * 1024 * 1024,
+            retry_after=limits["retry_after"],
+        )
+
+    def try_acquire(self, size: int) -> str | None:
+        """
+        Returns None if admitted, otherwise the reason for rejection.
+        """
+        with self._lock:
+            if size > self.max_bytes:
+                reason = "too_large"
+            elif self.in_flight >= self.max_renders:
+                reason = "renders"
+            elif self.in_flight_bytes + size > self.max_bytes:
+                reason = "bytes"
+            else:
+                self.in_flight += 1
+                self.in_flight_bytes += size
+                self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+                self.admitted += 1
+                return None
+
+            self.rejected[reason] += 1
+            return reason
+
+    def release(self, size: int):
+        with self._lock:
+            self.in_flight -= 1
+            self.in_flight_bytes -= size
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_inflight_renders": self.max_renders,
+                "max_inflight_bytes": self.max_bytes,
+                "in_flight": self.in_flight,
+                "in_flight_bytes": self.in_flight_bytes,
+                "peak_in_flight": self.peak_in_flight,
+                "admitted": self.admitted,
+                "rejected": dict(self.rejected),
+            }
+
+
+def header(scope, name: bytes) -> bytes | None:
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value
+    return None
+
+
+def content_length(scope) -> int:
+    try:
+        return max(0, int(header(scope, b"content-length") or 0))
+    except ValueError:
+        return 0
+
+
+async def send_json(send, status_code: int, body: dict, headers: list | None = None):
+    data = json.dumps(body).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(data)).encode()),
+            *(headers or []),
+        ],
+    })
+    await send({"type": "http.response.body", "body": data})
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware, so that rejected requests are answered before
+    their body is read and parsed into a Payload.
+    """
+
+    def __init__(self, app, controller: AdmissionController, paths=("/api/forms/process",)):
+        self.app = app
+        self.controller = controller
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        size = content_length(scope)
+        reason = self.controller.try_acquire(size)
+
+        if reason == "too_large":
+            print(f"🔴 Submission rejected: payload of {size // 1024} KB exceeds the in-flight limit")
+            await send_json(send, 413, {"detail": "Submission too large"})
+            return
+
+        if reason:
+            print(f"🟡 Server busy ({reason}), asked client to retry in {self.controller.retry_after}s")
+            await send_json(
+                send,
+                503,
+                {"detail": "Server busy, please retry shortly"},
+                headers=[(b"retry-after", str(self.controller.retry_after).encode())],
+            )
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(size)
+
+
+class SubmissionGateMiddleware:
+    """
+    Cheap checks on the request line and headers only, so wrong-password,
+    oversized or malformed submissions are rejected before any of the body
+    is read or validated.
+
+    The password is taken from the X-Submission-Password header. Clients that
+    still send it only in the body are let through and checked in process_forms.
+    """
+
+    def __init__(self, app, max_bytes: int, paths=("/api/forms/process",)):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        content_type = (header(scope, b"content-type") or b"").split(b";")[0].strip().lower()
+        if content_type != b"application/json":
+            await send_json(send, 415, {"detail": "Expected a JSON submission"})
+            return
+
+        if header(scope, b"content-length") is None:
+            await send_json(send, 411, {"detail": "Content-Length required"})
+            return
+
+        if content_length(scope) > self.max_bytes:
+            print(f"🔴 Submission rejected: payload of {content_length(scope) // 1024} KB exceeds max_payload_mb")
+            await send_json(send, 413, {"detail": "Submission too large"})
+            return
+
+        supplied = header(scope, b"x-submission-password")
+        if supplied is not None:
+            expected = scope["app"].state.SUBMISSION_PASSWORD.encode("utf-8")
+            if not secrets.compare_digest(supplied, expected):
+                print("🔴 Submission attempt blocked: Invalid password")
+                await send_json(send, 401, {"detail": "Invalid password"})
+                return
+
+        await self.app(scope, receive, send)
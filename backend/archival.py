@@ -0,0 +1,255 @@
+import configparser
+from datetime import datetime
+import json
+import os
+import threading
+import time
+import zipfile
+
+from backend.atomic import FileLock, committer, publish, write_temp
+from backend.pdf_utils.send_mail import CONFIG_PATH, ensure_config
+from backend.submissions import names_lock
+
+
+# Archival of old submissions.
+#
+# Submissions (JSON + PDF) and daily TSV ledgers older than archive_after_days
+# are moved out of output/ into output/archive/<YYYY-MM>/<run>.zip, grouped by
+# the month they were last written. Each month folder keeps an index.jsonl with
+# one line per archived submission, so one can be found and read back for
+# regeneration without opening every zip.
+
+
+ARCHIVE_DIR = "archive"
+INDEX_FILE = "index.jsonl"
+
+
+def read_archive_settings():
+    try:
+        ensure_config()
+    except RuntimeError as e:
+        print(e)
+
+    cfg = configparser.ConfigParser()
+    cfg.read(CONFIG_PATH, encoding="utf-8")
+
+    return {
+        # off unless configured: config.ini files from before [archive] existed never opted in
+        "archive_after_days": max(0, cfg.getint("archive", "archive_after_days", fallback=0)),
+        "run_every_hours": max(1, cfg.getint("archive", "run_every_hours", fallback=24)),
+    }
+
+
+def month_of(mtime: float) -> str:
+    return datetime.fromtimestamp(mtime).strftime("%Y-%m")
+
+
+def find_old(output_dir: str, cutoff: float) -> dict[str, list[dict]]:
+    """
+    Files older than cutoff, grouped by month:
+    {"2025-01": [{"name", "arcname", "path", "mtime", "size"}, ...]}
+    """
+    months: dict[str, list[dict]] = {}
+
+    def add(path, arcname, name, kind):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        if st.st_mtime >= cutoff:
+            return
+        months.setdefault(month_of(st.st_mtime), []).append({
+            "name": name, "kind": kind, "arcname": arcname, "path": path,
+            "mtime": st.st_mtime, "size": st.st_size,
+        })
+
+    for entry in os.scandir(output_dir):
+        if entry.is_file() and entry.name.endswith(".json"):
+            name = entry.name[:-5]
+            add(entry.path, entry.name, name, "json")
+
+            pdf = os.path.join(output_dir, "PDF", f"{name}.pdf")
+            if os.path.exists(pdf):
+                add(pdf, f"PDF/{name}.pdf", name, "pdf")
+
+    tsv_dir = os.path.join(output_dir, "TSV")
+    if os.path.isdir(tsv_dir):
+        for entry in os.scandir(tsv_dir):
+            if entry.is_file() and entry.name.endswith(".tsv"):
+                add(entry.path, f"TSV/{entry.name}", entry.name, "tsv")
+
+    return months
+
+
+def compact_json(path: str) -> bytes:
+    # stored JSON is pretty-printed; the archive keeps it minified
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+
+def index_line(item: dict, archive: str, archived_at: str) -> dict:
+    line = {"name": item["name"], "archive": archive, "archived_at": archived_at,
+            "modified": datetime.fromtimestamp(item["mtime"]).isoformat(timespec="seconds")}
+
+    try:
+        with open(item["path"], "r", encoding="utf-8") as f:
+            f11 = json.load(f)["forms"]["form_11"]
+        line["member_name"] = f11["personal_details"]["member_name"]
+        line["date_of_birth"] = f11["personal_details"]["date_of_birth"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    return line
+
+
+def write_month(output_dir: str, month: str, items: list[dict], runstamp: str) -> dict:
+    month_dir = os.path.join(output_dir, ARCHIVE_DIR, month)
+    os.makedirs(month_dir, exist_ok=True)
+
+    zip_name = f"{runstamp}.zip"
+    archived_at = datetime.now().isoformat(timespec="seconds")
+
+    # the zip is built in a temp file and published in one rename
+    tmp_path = write_temp(month_dir, b"")
+    try:
+        with zipfile.ZipFile(tmp_path, "w") as zf:
+            for item in items:
+                if item["kind"] == "json":
+                    zf.writestr(item["arcname"], compact_json(item["path"]), zipfile.ZIP_DEFLATED)
+                elif item["kind"] == "pdf":
+                    # PDF streams are already compressed
+                    zf.write(item["path"], item["arcname"], zipfile.ZIP_STORED)
+                else:
+                    zf.write(item["path"], item["arcname"], zipfile.ZIP_DEFLATED)
+
+        with open(tmp_path, "rb+") as f:
+            committer.sync(f)
+        publish(tmp_path, os.path.join(month_dir, zip_name))
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    lines = [
+        json.dumps(index_line(item, f"{month}/{zip_name}", archived_at), ensure_ascii=False)
+        for item in items if item["kind"] == "json"
+    ]
+    with FileLock(os.path.join(month_dir, ".index.lock")):
+        with open(os.path.join(month_dir, INDEX_FILE), "a", encoding="utf-8") as f:
+            f.write("".join(line + "\n" for line in lines))
+            committer.sync(f)
+
+    return {"archive": f"{month}/{zip_name}", "submissions": len(lines), "files": len(items)}
+
+
+def remove_archived(output_dir: str, items: list[dict]) -> int:
+    """
+    Deletes the archived originals, unless they were rewritten in the meantime
+    (e.g. a correction was submitted while the zip was being written).
+    """
+    removed = 0
+    with names_lock(output_dir):
+        for item in items:
+            try:
+                st = os.stat(item["path"])
+            except OSError:
+                continue
+            if st.st_mtime != item["mtime"] or st.st_size != item["size"]:
+                continue
+
+            os.unlink(item["path"])
+            removed += 1
+    return removed
+
+
+_run_lock = threading.Lock()
+
+
+def archive_old(output_dir: str, older_than_days: int | None = None) -> dict:
+    """
+    Moves everything older than older_than_days into the monthly archives.
+    """
+    if older_than_days is None:
+        older_than_days = read_archive_settings()["archive_after_days"]
+
+    report = {"archives": [], "removed": 0, "seconds": 0}
+    if older_than_days <= 0:
+        return report
+
+    started = time.time()
+    runstamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    cutoff = started - older_than_days * 86400
+
+    # one run at a time; a scheduled run and an admin trigger can overlap
+    with _run_lock:
+        for month, items in sorted(find_old(output_dir, cutoff).items()):
+            report["archives"].append(write_month(output_dir, month, items, runstamp))
+            report["removed"] += remove_archived(output_dir, items)
+
+    report["seconds"] = round(time.time() - started, 2)
+    return report
+
+
+def find_archived(output_dir: str, name: str) -> dict | None:
+    """
+    Latest index entry for a submission name, newest month first.
+    """
+    root = os.path.join(output_dir, ARCHIVE_DIR)
+    if not os.path.isdir(root):
+        return None
+
+    for month in sorted(os.listdir(root), reverse=True):
+        index = os.path.join(root, month, INDEX_FILE)
+        if not os.path.exists(index):
+            continue
+
+        found = None
+        with open(index, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue   # a torn last line after a crash
+                if entry.get("name") == name:
+                    found = entry
+        if found:
+            return found
+
+    return None
+
+
+def read_archived(output_dir: str, name: str, kind: str = "json") -> bytes | None:
+    """
+    Reads an archived submission's JSON (or PDF, kind="pdf") back out of its zip.
+    """
+    entry = find_archived(output_dir, name)
+    if entry is None:
+        return None
+
+    arcname = f"{name}.json" if kind == "json" else f"PDF/{name}.pdf"
+    with zipfile.ZipFile(os.path.join(output_dir, ARCHIVE_DIR, entry["archive"])) as zf:
+        try:
+            return zf.read(arcname)
+        except KeyError:
+            return None
+
+
+def start_archiver(output_dir: str):
+    """
+    Runs archive_old in a daemon thread every run_every_hours.
+    """
+    def loop():
+        # leave startup alone
+        time.sleep(60)
+        while True:
+            settings = read_archive_settings()
+            try:
+                report = archive_old(output_dir, settings["archive_after_days"])
+                if report["removed"]:
+                    print(f"🗄️ Archived {report['removed']} old files in {report['seconds']}s")
+            except Exception as e:
+                print(f"⚠️ Archival failed: {e}")
+
+            time.sleep(settings["run_every_hours"] * 3600)
+
+    threading.Thread(target=loop, name="archiver", daemon=True).start()
@@ -1,22 +1,39 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import glob
+import io
+import multiprocessing
 import os
 import subprocess
 import sys
+import time
 from PIL import Image
 import re
-import tempfile
-import shutil
-import tkinter as tk
-from tkinter import filedialog, messagebox
 
 
 # pyinstaller --onefile --noconsole --icon=../public/favicon.ico --name=Resize resize.py
+#
+# Headless batch mode (no dialog), over a pool of processes:
+#   python resize.py "D:\scans" --workers 4
+#   python resize.py "D:\scans\*.jpg" --out D:\resized
 
 
 MIN_SIZE = 50 * 1024    # 50 KB
 MAX_SIZE = 100 * 1024   # 100 KB
 
+MIN_QUALITY = 40
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+
+# Attempts resize from a working copy no larger than this (longest side, pixels)
+# instead of from the full-resolution scan. A 100 KB JPEG never needs more.
+WORKING_SIZE = 2400
+
 
 def pick_input_folder() -> str | None:
+    import tkinter as tk
+    from tkinter import filedialog
+
     root = tk.Tk()
     root.withdraw()  # hide main window
     root.attributes("-topmost", True)
@@ -30,7 +47,7 @@ def pick_input_folder() -> str | None:
 
 def has_images(folder: str) -> bool:
     return any(
-        f.lower().endswith((".png", ".jpg", ".jpeg", ".webp"))
+        f.lower().endswith(IMAGE_EXTENSIONS)
         for f in os.listdir(folder)
     )
 
@@ -49,51 +66,149 @@ def safe_filename(name: str) -> str:
     name = re.sub(r'[<>:"/\\|?*]', "_", name) # illegal Windows chars
     return name
 
-def process_image(img_path, out_path):
-    img = Image.open(img_path).convert("RGB")
+def working_copy(img_path) -> Image.Image:
+    """
+    The image, decoded once and reduced to WORKING_SIZE.
+    """
+    img = Image.open(img_path)
+
+    if max(img.size) > WORKING_SIZE:
+        img.draft("RGB", (WORKING_SIZE, WORKING_SIZE))  # JPEGs decode straight at 1/2, 1/4, ...
+        img.thumbnail((WORKING_SIZE, WORKING_SIZE), Image.LANCZOS)
+
+    return img.convert("RGB")
+
+
+def process_image(img_path, out_path, verbose=True) -> dict:
+    started = time.perf_counter()
+    img = working_copy(img_path)
 
     base_w, base_h = img.size
+
     scale = 1.0
     quality = 90
     attempts = 0
     MAX_ATTEMPTS = 20
+    resized_cache = {}
 
     while attempts < MAX_ATTEMPTS:
         attempts += 1
 
-        new_w = int(base_w * scale)
-        new_h = int(base_h * scale)
-
-        resized = img.resize((new_w, new_h), Image.BICUBIC)
+        new_w = max(1, int(base_w * scale))
+        new_h = max(1, int(base_h * scale))
 
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
-            temp_path = tmp.name
+        # only quality changes between most attempts: reuse the resized copy
+        resized = resized_cache.get((new_w, new_h))
+        if resized is None:
+            resized = img if img.size == (new_w, new_h) else img.resize((new_w, new_h), Image.BICUBIC)
+            resized_cache[(new_w, new_h)] = resized
 
-        resized.save(temp_path, format="JPEG", quality=quality)
-        size = os.path.getsize(temp_path)
+        buf = io.BytesIO()
+        resized.save(buf, format="JPEG", quality=quality)
+        size = buf.tell()
 
-        print(f"  → attempt {attempts}: {new_w}x{new_h}, {size // 1024} KB")
+        if verbose:
+            print(f"  → attempt {attempts}: {new_w}x{new_h}, {size // 1024} KB")
 
         if MIN_SIZE <= size <= MAX_SIZE:
-            shutil.move(temp_path, out_path)
-            print("  ✅ size OK")
-            return
-
-        os.remove(temp_path)
+            break
 
         # 🚀 Windows-style inflation logic
         if size < MIN_SIZE:
             scale *= 1.35          # increase resolution
             quality = min(95, quality + 5)
+        elif quality > MIN_QUALITY:
+            quality = max(MIN_QUALITY, quality - 7)   # reduce size
         else:
-            quality -= 7           # reduce size
-
-    # fallback save
-    resized.save(out_path, format="JPEG", quality=quality)
-    print("  ⚠️ saved best possible version")
+            scale *= 0.75          # lowest quality and still too big: reduce resolution
+
+    in_range = MIN_SIZE <= size <= MAX_SIZE
+    if verbose:
+        print("  ✅ size OK" if in_range else "  ⚠️ saved best possible version")
+
+    with open(out_path, "wb") as f:
+        f.write(buf.getvalue())
+
+    return {
+        "file": os.path.basename(img_path),
+        "width": new_w,
+        "height": new_h,
+        "bytes": size,
+        "attempts": attempts,
+        "in_range": in_range,
+        "ms": round((time.perf_counter() - started) * 1000),
+    }
+
+
+def output_path(output_dir, filename) -> str:
+    clean_name = safe_filename(os.path.splitext(filename)[0]) + ".jpg"
+    return os.path.join(output_dir, clean_name)
+
+
+def find_images(inputs) -> list[str]:
+    """
+    Image files from a list of folders and / or glob patterns.
+    """
+    paths = []
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "*")
+        paths.extend(
+            p for p in sorted(glob.glob(pattern))
+            if os.path.isfile(p) and p.lower().endswith(IMAGE_EXTENSIONS)
+        )
+    return list(dict.fromkeys(paths))
+
+
+def run_batch(paths, output_dir=None, workers=None):
+    jobs = []
+    for path in paths:
+        out_dir = output_dir or os.path.join(os.path.dirname(path), "output_images")
+        os.makedirs(out_dir, exist_ok=True)
+        jobs.append((path, output_path(out_dir, os.path.basename(path)), False))
+
+    started = time.time()
+    done = in_range = total_bytes = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for job, future in zip(jobs, [pool.submit(process_image, *job) for job in jobs]):
+            try:
+                r = future.result()
+            except Exception as e:
+                print(f"❌ {os.path.basename(job[0])}: {e}")
+                continue
+
+            done += 1
+            in_range += r["in_range"]
+            total_bytes += os.path.getsize(job[0])
+
+            mark = "✅" if r["in_range"] else "⚠️"
+            print(f"{mark} {r['file']}: {r['width']}x{r['height']}, {r['bytes'] // 1024} KB ({r['attempts']} attempts, {r['ms']} ms)")
+
+    elapsed = max(time.time() - started, 1e-6)
+    print(
+        f"✅ {done} of {len(jobs)} images in {elapsed:.1f}s, {in_range} within size "
+        f"({done / elapsed:.1f} images/s, {total_bytes / 1024 / 1024 / elapsed:.1f} MB/s read)"
+    )
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Resize images to 50-100 KB JPEGs")
+    parser.add_argument("inputs", nargs="*", help="folders or glob patterns (none: pick a folder)")
+    parser.add_argument("--out", help="output folder (default: output_images next to each image)")
+    parser.add_argument("--workers", type=int, default=None, help="parallel processes (default: all cores)")
+    args = parser.parse_args()
+
+    if args.inputs:
+        paths = find_images(args.inputs)
+        if not paths:
+            print("❌ No PNG, JPG, JPEG or WEBP images found")
+            sys.exit(1)
+        run_batch(paths, args.out, args.workers)
+        return
+
+    from tkinter import messagebox
+
     while True:
         input_dir = pick_input_folder()
 
@@ -115,20 +230,14 @@ def main():
     os.makedirs(output_dir, exist_ok=True)
 
     for filename in os.listdir(input_dir):
-        if filename.lower().endswith((".png", ".jpg", ".jpeg", ".webp")):
-            clean_name = safe_filename(
-                os.path.splitext(filename)[0]
-            ) + ".jpg"
-
+        if filename.lower().endswith(IMAGE_EXTENSIONS):
             in_path = os.path.join(input_dir, filename)
-            out_path = os.path.join(output_dir, clean_name)
-
-            process_image(in_path, out_path)
+            process_image(in_path, output_path(output_dir, filename))
 
     open_folder(output_dir)
 
 
 if __name__ == "__main__":
+    # batch mode resizes in worker processes; required for the frozen exe
+    multiprocessing.freeze_support()
     main()
-
-
@@ -0,0 +1,196 @@
+import os
+import queue
+import tempfile
+import threading
+import time
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+
+# Crash-safe output writes.
+#
+# Files are written to a temp file next to their destination, fsync'd and then
+# renamed over the final path, so a reader (or combine_json_to_excel) only ever
+# sees the old file or the complete new one - never half of it, even if the
+# server is killed mid-write.
+#
+# fsyncs are group-committed: concurrent writers hand their files to one
+# background thread, which flushes everything that queued up during a short
+# window together and then wakes all of them.
+
+
+FSYNC_WINDOW = 0.005   # seconds a batch stays open for more writers
+STALE_TEMP_AGE = 3600  # temp files older than this are leftovers of a crash
+
+
+def umask_mode() -> int:
+    # the mode open() would give a new file; mkstemp always uses 0600
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+FILE_MODE = umask_mode()
+
+
+class FileLock:
+    """
+    Exclusive lock on a lock file, shared with other processes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def __enter__(self):
+        self.f = open(self.path, "a+b")
+        if os.name == "nt":
+            self.f.seek(0)
+            # LK_LOCK retries for ~10 s before giving up
+            msvcrt.locking(self.f.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            if os.name == "nt":
+                self.f.seek(0)
+                msvcrt.locking(self.f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(self.f.fileno(), fcntl.LOCK_UN)
+        finally:
+            self.f.close()
+
+
+class GroupCommitter:
+    """
+    Background fsync thread. sync(f) blocks until f has reached the disk.
+    """
+
+    def __init__(self, window: float = FSYNC_WINDOW):
+        self.window = window
+        self.batches = 0
+        self.files = 0
+
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_thread(self):
+        # started lazily, and again in forked / spawned worker processes
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="fsync", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+
+            # let other writers join this batch
+            time.sleep(self.window)
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            for fileno, done, errors in batch:
+                try:
+                    os.fsync(fileno)
+                except OSError as e:
+                    errors.append(e)
+
+            self.batches += 1
+            self.files += len(batch)
+
+            for _, done, _ in batch:
+                done.set()
+
+    def sync(self, f):
+        f.flush()
+
+        self._ensure_thread()
+        done, errors = threading.Event(), []
+        self._queue.put((f.fileno(), done, errors))
+        done.wait()
+
+        if errors:
+            raise errors[0]
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "files": self.files,
+            "files_per_batch": round(self.files / self.batches, 2) if self.batches else 0,
+        }
+
+
+committer = GroupCommitter()
+
+
+def sync_dir(path: str):
+    # makes the rename itself durable; directories can't be opened on Windows
+    if os.name == "nt":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_temp(directory: str, data: bytes | str) -> str:
+    """
+    Writes data to a synced temp file in directory and returns its path.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    try:
+        os.chmod(tmp_path, FILE_MODE)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data.encode("utf-8") if isinstance(data, str) else data)
+            committer.sync(f)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return tmp_path
+
+
+def publish(tmp_path: str, path: str):
+    os.replace(tmp_path, path)
+    sync_dir(os.path.dirname(path) or ".")
+
+
+def atomic_write(path: str, data: bytes | str):
+    """
+    Replaces path with data, all or nothing.
+    """
+    publish(write_temp(os.path.dirname(path) or ".", data), path)
+
+
+def cleanup_temp(directory: str) -> int:
+    """
+    Removes temp files left behind by a crash. Returns how many were removed.
+    """
+    removed = 0
+    if not os.path.isdir(directory):
+        return removed
+
+    cutoff = time.time() - STALE_TEMP_AGE
+    for name in os.listdir(directory):
+        if not (name.startswith(".") and name.endswith(".tmp")):
+            continue
+
+        path = os.path.join(directory, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.unlink(path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
@@ -0,0 +1,383 @@
+import argparse
+import base64
+import csv
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date, datetime
+import io
+import mimetypes
+import multiprocessing
+import os
+from pathlib import Path
+import time
+
+from PIL import Image
+from pydantic import ValidationError
+
+from backend.models import Payload
+from backend.submissions import store_submission
+
+
+# Bulk onboarding: the reverse of json_to_excel.extract_row.
+# Each sheet row becomes a Payload, is validated, and valid rows are pushed
+# through the normal submission pipeline in a process pool.
+#
+#   python -m backend.bulk_import hires.xlsx --docs ./scans --workers 4
+
+
+F11 = "forms.form_11"
+F2 = "forms.form_2"
+
+# header -> (json paths, value kind)
+COLUMNS = {
+    "Member Name": ((f"{F11}.personal_details.member_name", f"{F2}.member_name"), "upper"),
+    "Father / Husband Name": ((f"{F11}.personal_details.parent_spouse_name", f"{F2}.father_husband_name"), "upper"),
+    "Father / Spouse": ((f"{F11}.personal_details.parent_spouse_type",), "lower"),
+    "Date of Birth": ((f"{F11}.personal_details.date_of_birth", f"{F2}.date_of_birth"), "date"),
+    "Gender": ((f"{F11}.personal_details.gender", f"{F2}.gender"), "lower"),
+    "Marital Status": ((f"{F11}.personal_details.marital_status", f"{F2}.marital_status"), "lower"),
+    "Email": ((f"{F11}.contact_details.email",), "str"),
+    "Mobile Number": ((f"{F11}.contact_details.mobile_no", f"{F2}.mobile_no"), "str"),
+    "Permanent Address": ((f"{F2}.permanent_address",), "str"),
+    "Employee Number": ((f"{F2}.employee_no",), "str"),
+    "PF Account Number": ((f"{F2}.pf_account_no",), "upper"),
+
+    "Was EPF Member": ((f"{F11}.was_epf_member",), "bool"),
+    "Was EPS Member": ((f"{F11}.was_eps_member",), "bool"),
+    "UAN": ((f"{F11}.previous_employment.uan",), "str"),
+    "Previous PF Account Number": ((f"{F11}.previous_employment.previous_pf_account_no",), "upper"),
+    "Exit Date": ((f"{F11}.previous_employment.exit_date",), "date"),
+    "Scheme Certificate No": ((f"{F11}.previous_employment.scheme_certificate_no",), "str"),
+    "PPO No": ((f"{F11}.previous_employment.ppo_no",), "str"),
+
+    "International Worker": ((f"{F11}.international_worker.is_international_worker",), "bool"),
+    "Country of Origin": ((f"{F11}.international_worker.country_of_origin",), "str"),
+    "Passport No": ((f"{F11}.international_worker.passport_no",), "upper"),
+    "Passport Valid From": ((f"{F11}.international_worker.passport_validity_from",), "date"),
+    "Passport Valid To": ((f"{F11}.international_worker.passport_validity_to",), "date"),
+
+    "Bank Acc. No.": ((f"{F11}.kyc_details.bank_account_no",), "str"),
+    "Bank IFSC": ((f"{F11}.kyc_details.ifsc_code",), "upper"),
+    "Aadhaar": ((f"{F11}.kyc_details.aadhaar_no",), "str"),
+    "PAN": ((f"{F11}.kyc_details.pan_no",), "upper"),
+
+    "Place": ((f"{F11}.declaration.place", f"{F2}.declaration.place"), "str"),
+    "Declaration Date": ((f"{F11}.declaration.date", f"{F2}.declaration.date"), "date"),
+}
+
+for i in (1, 2):
+    COLUMNS.update({
+        f"Nominee {i} Name": ((f"{F2}.epf_nominees.{i - 1}.name",), "upper"),
+        f"Nominee {i} DOB": ((f"{F2}.epf_nominees.{i - 1}.date_of_birth",), "date"),
+        f"Nominee {i} Relationship": ((f"{F2}.epf_nominees.{i - 1}.relationship",), "str"),
+        f"Nominee {i} Address": ((f"{F2}.epf_nominees.{i - 1}.address",), "str"),
+        f"Nominee {i} Share": ((f"{F2}.epf_nominees.{i - 1}.share_percentage",), "float"),
+        f"Nominee {i} Guardian Name": ((f"{F2}.epf_nominees.{i - 1}.guardian_name",), "str"),
+        f"Nominee {i} Guardian Relationship": ((f"{F2}.epf_nominees.{i - 1}.guardian_relationship",), "str"),
+        f"Nominee {i} Guardian Address": ((f"{F2}.epf_nominees.{i - 1}.guardian_address",), "str"),
+
+        f"Family Member {i} Name": ((f"{F2}.eps_family_members.{i - 1}.name",), "upper"),
+        f"Family Member {i} DOB": ((f"{F2}.eps_family_members.{i - 1}.date_of_birth",), "date"),
+        f"Family Member {i} Relationship": ((f"{F2}.eps_family_members.{i - 1}.relationship",), "str"),
+        f"Family Member {i} Address": ((f"{F2}.eps_family_members.{i - 1}.address",), "str"),
+    })
+
+COLUMNS.update({
+    "Pension Nominee Name": ((f"{F2}.pension_nominee.name",), "upper"),
+    "Pension Nominee DOB": ((f"{F2}.pension_nominee.date_of_birth",), "date"),
+    "Pension Nominee Relationship": ((f"{F2}.pension_nominee.relationship",), "str"),
+    "Pension Nominee Address": ((f"{F2}.pension_nominee.address",), "str"),
+})
+
+HEADER_LOOKUP = {name.lower(): name for name in COLUMNS}
+
+DOCUMENT_KEYS = ("aadhaar", "pan", "passbook")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".pdf")
+
+
+#                                                                                --- READING ---
+
+
+def read_rows(source, kind: str):
+    """
+    Streams rows of a CSV or xlsx file as {header: value} dicts.
+    source is a path or a binary file object.
+    """
+    if kind == "csv":
+        f = open(source, "rb") if isinstance(source, (str, Path)) else source
+        text = io.TextIOWrapper(f, encoding="utf-8-sig", newline="")
+        yield from csv.DictReader(text)
+        return
+
+    if kind == "xlsx":
+        from openpyxl import load_workbook
+
+        wb = load_workbook(source, read_only=True, data_only=True)
+        try:
+            rows = wb.active.iter_rows(values_only=True)
+            headers = [str(h).strip() if h is not None else "" for h in next(rows, [])]
+            for values in rows:
+                if values is None or all(v is None or v == "" for v in values):
+                    continue
+                yield dict(zip(headers, values))
+        finally:
+            wb.close()
+        return
+
+    raise ValueError(f"Unsupported sheet type: {kind}")
+
+
+def sheet_kind(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower()
+    return {".csv": "csv", ".xlsx": "xlsx"}.get(ext, ext.lstrip("."))
+
+
+#                                                                                --- ROW -> PAYLOAD ---
+
+
+def to_iso_date(value) -> str:
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+
+    text = str(value).strip()
+    for fmt in ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y"):
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    raise ValueError(f"unrecognised date '{text}'")
+
+
+def convert(value, kind: str):
+    if kind == "date":
+        return to_iso_date(value)
+    if kind == "bool":
+        return str(value).strip().lower() in ("1", "true", "yes", "y")
+    if kind == "float":
+        return float(value)
+
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)  # numbers read from Excel, e.g. mobile numbers
+    text = str(value).strip()
+
+    if kind == "upper":
+        return text.upper()
+    if kind == "lower":
+        return text.lower()
+    return text
+
+
+def set_path(target: dict, path: str, value):
+    parts = path.split(".")
+    node = target
+    for part, nxt in zip(parts, parts[1:]):
+        key = int(part) if isinstance(node, list) else part
+        if isinstance(node, list):
+            while len(node) <= key:
+                node.append({})
+            node = node[key]
+        else:
+            node = node.setdefault(key, [] if nxt.isdigit() else {})
+
+    last = parts[-1]
+    if isinstance(node, list):
+        while len(node) <= int(last):
+            node.append({})
+        node[int(last)] = value
+    else:
+        node[last] = value
+
+
+def data_url(path: Path) -> tuple[str, str]:
+    mime = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    with open(path, "rb") as f:
+        encoded = base64.b64encode(f.read()).decode("ascii")
+    return mime, f"data:{mime};base64,{encoded}"
+
+
+def find_document(folder: Path, key: str) -> Path | None:
+    for ext in IMAGE_EXTENSIONS:
+        candidate = folder / f"{key}{ext}"
+        if candidate.exists():
+            return candidate
+    return None
+
+
+def row_documents(docs_dir: str | None, row_key: str) -> tuple[dict, dict | None, list[str]]:
+    """
+    Documents are looked up as <docs_dir>/<employee number or member name>/aadhaar.jpg,
+    pan.*, passbook.* and an optional signature.png.
+    """
+    errors = []
+    documents = {}
+    signature = None
+
+    folder = Path(docs_dir) / row_key if docs_dir else None
+
+    for key in DOCUMENT_KEYS:
+        found = find_document(folder, key) if folder else None
+        if not found:
+            errors.append(f"documents.{key}: missing {key} file in {folder or 'documents folder'}")
+            continue
+
+        mime, url = data_url(found)
+        documents[key] = {"name": found.name, "type": mime, "base64": url, "preview": None}
+
+    sig_path = folder / "signature.png" if folder else None
+    if sig_path and sig_path.exists():
+        _, url = data_url(sig_path)
+        with Image.open(sig_path) as img:
+            w, h = img.size
+        signature = {"image": url, "bbox": {"x": 0, "y": 0, "width": w, "height": h}}
+
+    return documents, signature, errors
+
+
+def row_to_payload(row: dict, docs_dir: str | None = None) -> Payload:
+    """
+    Builds and validates a Payload from one sheet row.
+    Raises ValueError with one message per problem.
+    """
+    data: dict = {}
+    errors = []
+
+    for header, value in row.items():
+        name = HEADER_LOOKUP.get(str(header or "").strip().lower())
+        if not name or value is None or str(value).strip() == "":
+            continue
+
+        paths, kind = COLUMNS[name]
+        try:
+            converted = convert(value, kind)
+        except ValueError as e:
+            errors.append(f"{name}: {e}")
+            continue
+
+        for path in paths:
+            set_path(data, path, converted)
+
+    forms = data.setdefault("forms", {})
+    f11 = forms.setdefault("form_11", {})
+    f2 = forms.setdefault("form_2", {})
+
+    f11.setdefault("was_epf_member", False)
+    f11.setdefault("was_eps_member", False)
+    f11.setdefault("previous_employment", {})
+    f11.setdefault("international_worker", {"is_international_worker": False})
+    f11["personal_details"] = {"parent_spouse_type": "father", **f11.get("personal_details", {})}
+
+    today = date.today().isoformat()
+    for form in (f11, f2):
+        form["declaration"] = {"date": today, "same_signature": True, **form.get("declaration", {})}
+
+    nominees = [n for n in f2.get("epf_nominees", []) if n]
+    for n in nominees:
+        n.setdefault("share_percentage", round(100 / len(nominees), 2))
+        n.setdefault("address", f2.get("permanent_address", ""))
+        n["is_minor"] = bool(n.get("guardian_name"))
+    f2["epf_nominees"] = nominees
+    f2["eps_family_members"] = [m for m in f2.get("eps_family_members", []) if m]
+    f2.setdefault("has_no_family_epf", not nominees)
+    f2.setdefault("dependent_parents", False)
+    f2.setdefault("has_no_family_eps", not f2["eps_family_members"])
+
+    row_key = f2.get("employee_no") or f11.get("personal_details", {}).get("member_name", "")
+    documents, signature, doc_errors = row_documents(docs_dir, str(row_key))
+    errors.extend(doc_errors)
+
+    f11["declaration"]["signature_data"] = signature
+    f2["declaration"]["signature_data"] = signature
+
+    data["documents"] = documents
+    data["meta"] = {"exported_at": datetime.now().isoformat(), "version": "bulk-import"}
+
+    try:
+        payload = Payload.model_validate(data)
+    except ValidationError as e:
+        errors.extend(
+            f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}"
+            for err in e.errors()
+            if not (err["loc"] and err["loc"][0] == "documents" and doc_errors)
+        )
+        payload = None
+
+    if errors:
+        raise ValueError(errors)
+    return payload
+
+
+#                                                                                --- PIPELINE ---
+
+
+def import_one(payload: Payload, output_dir: str) -> str:
+    return store_submission(payload, output_dir)["base_filename"]
+
+
+def import_sheet(source, kind: str, output_dir: str, docs_dir: str | None = None, workers: int | None = None) -> dict:
+    """
+    Validates every row and renders the valid ones in parallel.
+    Rows are read lazily, and at most 2 * workers renders are queued at a time.
+    """
+    workers = workers or max(1, (os.cpu_count() or 2) - 1)
+    started = time.time()
+
+    report = {"rows": 0, "imported": [], "errors": []}
+    pending = {}
+
+    def collect(done):
+        for future in done:
+            row_no, name = pending.pop(future)
+            try:
+                report["imported"].append(future.result())
+            except Exception as e:
+                report["errors"].append({"row": row_no, "name": name, "errors": [f"render failed: {e}"]})
+
+    # spawn, never fork: forking the threaded server copies locks that may be held
+    # (names_lock, the ledger), and a worker waiting on one would hang for good
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        # row 1 is the header
+        for row_no, row in enumerate(read_rows(source, kind), start=2):
+            report["rows"] += 1
+            name = str(row.get("Member Name") or "").strip()
+
+            try:
+                payload = row_to_payload(row, docs_dir)
+            except ValueError as e:
+                messages = e.args[0] if e.args and isinstance(e.args[0], list) else [str(e)]
+                report["errors"].append({"row": row_no, "name": name, "errors": messages})
+                continue
+
+            if len(pending) >= workers * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+
+            pending[pool.submit(import_one, payload, output_dir)] = (row_no, name)
+
+        collect(wait(pending).done)
+
+    report["seconds"] = round(time.time() - started, 2)
+    report["errors"].sort(key=lambda e: e["row"])
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create PF submissions from a CSV / xlsx sheet")
+    parser.add_argument("sheet", help="path to the .csv or .xlsx file")
+    parser.add_argument("--docs", help="folder with one sub-folder of documents per employee")
+    parser.add_argument("--output", default=str(Path.cwd() / "output"), help="output folder")
+    parser.add_argument("--workers", type=int, default=None, help="parallel render processes")
+    args = parser.parse_args()
+
+    report = import_sheet(args.sheet, sheet_kind(args.sheet), args.output, args.docs, args.workers)
+
+    for err in report["errors"]:
+        print(f"❌ Row {err['row']} ({err['name'] or 'no name'}):")
+        for message in err["errors"]:
+            print(f"     {message}")
+
+    print(f"✅ Imported {len(report['imported'])} of {report['rows']} rows in {report['seconds']}s")
+
+
+if __name__ == "__main__":
+    main()
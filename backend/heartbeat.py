@@ -0,0 +1,179 @@
+import asyncio
+import itertools
+import json
+import time
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+
+KILL_AFTER = 15    # seconds without any admin connected before shutting down
+STALE_AFTER = 60   # seconds without a ping before a connection is considered dead
+EVENT_BUFFER = 100  # messages queued per connection; a slow page loses the oldest events
+
+
+class AdminConnection:
+    def __init__(self, conn_id: int, ws: WebSocket):
+        self.id = conn_id
+        self.ws = ws
+        self.connected_at = time.time()
+        self.last_seen = self.connected_at
+        self.rtt_ms: float | None = None
+        self.outgoing: asyncio.Queue[str] = asyncio.Queue(maxsize=EVENT_BUFFER)
+        self.dropped = 0
+
+    def send(self, msg: str):
+        # only called on the event loop; never blocks on a slow client
+        if self.outgoing.full():
+            self.outgoing.get_nowait()
+            self.dropped += 1
+        self.outgoing.put_nowait(msg)
+
+
+class HeartbeatMonitor:
+    """
+    Tracks every connected admin page.
+
+    Each connection has its own deadline (a ping must arrive within STALE_AFTER),
+    enforced by the receive itself rather than a polling loop.
+    Shutdown is a single timer, armed when the last connection goes away and
+    cancelled as soon as any admin (re)connects or pings.
+
+    The same sockets carry server events (publish) to every connected page.
+    """
+
+    def __init__(self, on_expire, kill_after: float = KILL_AFTER, stale_after: float = STALE_AFTER, snapshot=None):
+        self.on_expire = on_expire
+        self.kill_after = kill_after
+        self.stale_after = stale_after
+        self.snapshot = snapshot   # () -> dict, sent as the first event of each connection
+
+        self.connections: dict[int, AdminConnection] = {}
+        self._ids = itertools.count(1)
+        self._shutdown: asyncio.TimerHandle | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self.events_published = 0
+
+    def _rearm(self):
+        if self._shutdown is not None:
+            self._shutdown.cancel()
+            self._shutdown = None
+
+        if not self.connections:
+            loop = asyncio.get_running_loop()
+            self._shutdown = loop.call_later(self.kill_after, self._expire)
+
+    def _expire(self):
+        self._shutdown = None
+        if not self.connections:
+            self.on_expire()
+
+    def connect(self, ws: WebSocket) -> AdminConnection:
+        conn = AdminConnection(next(self._ids), ws)
+        self.connections[conn.id] = conn
+        self._rearm()
+        return conn
+
+    def disconnect(self, conn: AdminConnection):
+        if self.connections.pop(conn.id, None) is not None:
+            self._rearm()
+
+    def ping(self, conn: AdminConnection, rtt_ms: float | None = None):
+        conn.last_seen = time.time()
+        if rtt_ms is not None:
+            conn.rtt_ms = rtt_ms
+        self._rearm()
+
+    #                                                                                --- EVENTS ---
+
+    def publish(self, event: dict):
+        """
+        Sends event to every connected admin page as "event:<json>".
+        Safe to call from any thread; does nothing while no admin is connected.
+        """
+        loop = self._loop
+        if loop is None or not self.connections:
+            return
+
+        msg = "event:" + json.dumps({"time": time.time(), **event}, default=str)
+        try:
+            loop.call_soon_threadsafe(self._fan_out, msg)
+        except RuntimeError:   # loop closed, shutting down
+            pass
+
+    def _fan_out(self, msg: str):
+        self.events_published += 1
+        for conn in list(self.connections.values()):
+            conn.send(msg)
+
+    async def _sender(self, conn: AdminConnection):
+        # the only writer of the socket: pongs and events never interleave
+        try:
+            while True:
+                await conn.ws.send_text(await conn.outgoing.get())
+        except Exception:
+            pass   # disconnected: the receive loop notices and cleans up
+
+    async def serve(self, ws: WebSocket):
+        """
+        Client messages: "ping" or "ping:<client_ts>[:<last_rtt_ms>]".
+        Timestamped pings are echoed back as "pong:<client_ts>" so the
+        client can measure the round trip and report it with the next ping.
+        Server events are pushed as "event:<json>", starting with a snapshot.
+        """
+        await ws.accept()
+        self._loop = asyncio.get_running_loop()
+        conn = self.connect(ws)
+        print(f"🟢 Frontend connected ({len(self.connections)} open)")
+
+        if self.snapshot is not None:
+            conn.send("event:" + json.dumps({"type": "snapshot", "time": time.time(), **self.snapshot()}, default=str))
+        sender = asyncio.create_task(self._sender(conn))
+
+        try:
+            while True:
+                try:
+                    msg = await asyncio.wait_for(ws.receive_text(), timeout=self.stale_after)
+                except asyncio.TimeoutError:
+                    print("🟡 Frontend stopped responding, closing its connection")
+                    await ws.close(code=4408)
+                    break
+
+                if not msg.startswith("ping"):
+                    continue
+
+                parts = msg.split(":")
+                rtt_ms = None
+                if len(parts) > 2:
+                    try:
+                        rtt_ms = float(parts[2])
+                    except ValueError:
+                        pass
+
+                self.ping(conn, rtt_ms)
+
+                if len(parts) > 1:
+                    conn.send(f"pong:{parts[1]}")
+        except WebSocketDisconnect:
+            pass
+        finally:
+            sender.cancel()
+            self.disconnect(conn)
+            print(f"🔴 Frontend disconnected ({len(self.connections)} open)")
+
+    def stats(self) -> dict:
+        now = time.time()
+        return {
+            "connections": len(self.connections),
+            "shutdown_pending": self._shutdown is not None,
+            "events_published": self.events_published,
+            "clients": [
+                {
+                    "id": conn.id,
+                    "connected_for": round(now - conn.connected_at, 1),
+                    "last_seen_ago": round(now - conn.last_seen, 1),
+                    "rtt_ms": conn.rtt_ms,
+                    "events_dropped": conn.dropped,
+                }
+                for conn in list(self.connections.values())
+            ],
+        }
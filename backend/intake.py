@@ -0,0 +1,323 @@
+import argparse
+import base64
+import configparser
+from concurrent.futures import ProcessPoolExecutor
+import io
+import os
+from pathlib import Path
+import re
+import time
+
+import numpy as np
+from PIL import Image, ImageFilter, ImageOps
+
+from backend.models import StoredDocument, StoredDocumentUploads
+from backend.pdf_utils.images import decode
+from backend.pdf_utils.send_mail import CONFIG_PATH, ensure_config
+
+
+# Document intake: the scan filters of archive/scan.py and the size targeting of
+# archive/resize.py, done in memory.
+#
+# The 50-100 KB target (the EPFO portal's limit for KYC scans) is reached with
+# binary searches - on JPEG quality first, then on scale - rather than stepping
+# a fixed multiplier, so an image takes a handful of encodes (at most ~16) and
+# never touches the disk.
+#
+#   python -m backend.intake ./scans --filter enhance --workers 4
+
+
+MIN_SIZE = 50 * 1024    # 50 KB
+MAX_SIZE = 100 * 1024   # 100 KB
+
+MIN_QUALITY = 30
+MAX_QUALITY = 95
+MAX_UPSCALE = 4.0
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+IMAGE_FORMATS = ("JPEG", "PNG", "WEBP")
+
+
+def read_intake_settings():
+    try:
+        ensure_config()
+    except RuntimeError as e:
+        print(e)
+
+    cfg = configparser.ConfigParser()
+    cfg.read(CONFIG_PATH, encoding="utf-8")
+
+    filter_name = cfg.get("documents", "filter", fallback="none").strip().lower()
+    return {
+        "compress": cfg.getboolean("documents", "compress", fallback=False),
+        "filter": filter_name if filter_name in FILTERS else None,
+        "min_kb": max(1, cfg.getint("documents", "min_kb", fallback=MIN_SIZE // 1024)),
+        "max_kb": max(2, cfg.getint("documents", "max_kb", fallback=MAX_SIZE // 1024)),
+    }
+
+
+#                                                                                --- FILTERS ---
+
+
+def adaptive_threshold(gray: np.ndarray, local_mean: np.ndarray, c: float) -> np.ndarray:
+    # white where a pixel is lighter than its neighbourhood (minus c), black elsewhere
+    return np.where(gray.astype(np.float32) > local_mean.astype(np.float32) - c, 255, 0).astype(np.uint8)
+
+
+def scan_effect(img: Image.Image) -> Image.Image:
+    """
+    Black-and-white "scanned" look: denoise, then Gaussian adaptive threshold
+    (11 px neighbourhood, C = 2) as in archive/scan.py.
+    """
+    gray = img.convert("L").filter(ImageFilter.GaussianBlur(1.1))
+    local = gray.filter(ImageFilter.GaussianBlur(2.0))
+    return Image.fromarray(adaptive_threshold(np.asarray(gray), np.asarray(local), 2), "L")
+
+
+def enhance_scan(img: Image.Image) -> Image.Image:
+    """
+    Contrast stretch, then mean adaptive threshold (15 px neighbourhood, C = 10).
+    """
+    gray = ImageOps.autocontrast(img.convert("L")).filter(ImageFilter.GaussianBlur(1.1))
+    local = gray.filter(ImageFilter.BoxBlur(7))
+    return Image.fromarray(adaptive_threshold(np.asarray(gray), np.asarray(local), 10), "L")
+
+
+FILTERS = {
+    "scan": scan_effect,
+    "enhance": enhance_scan,
+}
+
+
+def flatten(img: Image.Image) -> Image.Image:
+    """
+    RGB / L copy of img. Transparent areas (screenshots, e-PAN / e-Aadhaar exports)
+    become white, not the black a plain convert gives them.
+    """
+    if img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info):
+        rgba = img.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    return img if img.mode in ("RGB", "L") else img.convert("RGB")
+
+
+#                                                                                --- SIZE TARGETING ---
+
+
+class Encoder:
+    """
+    Encodes one image at (scale, quality), remembering every attempt.
+    """
+
+    def __init__(self, img: Image.Image):
+        self.img = flatten(img)
+        self.attempts = 0
+        self._cache: dict[tuple[float, int], bytes] = {}
+
+    def encode(self, scale: float, quality: int) -> bytes:
+        key = (round(scale, 4), quality)
+        if key in self._cache:
+            return self._cache[key]
+
+        self.attempts += 1
+        img = self.img
+        if key[0] != 1.0:
+            size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+            img = img.resize(size, Image.Resampling.LANCZOS if scale < 1 else Image.Resampling.BICUBIC)
+
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=quality, optimize=True)
+        data = buf.getvalue()
+        self._cache[key] = data
+        return data
+
+
+def best_quality(enc: Encoder, scale: float, max_bytes: int) -> int | None:
+    """
+    Highest quality whose output fits in max_bytes at this scale.
+    """
+    # small images already fit at the top quality
+    if len(enc.encode(scale, MAX_QUALITY)) <= max_bytes:
+        return MAX_QUALITY
+
+    lo, hi, best = MIN_QUALITY, MAX_QUALITY - 1, None
+    while lo <= hi:
+        q = (lo + hi) // 2
+        if len(enc.encode(scale, q)) <= max_bytes:
+            best, lo = q, q + 1
+        else:
+            hi = q - 1
+    return best
+
+
+def find_scale(enc: Encoder, quality: int, min_bytes: int, max_bytes: int, lo: float, hi: float) -> float:
+    """
+    Scale in [lo, hi] whose output lands between min_bytes and max_bytes at this quality.
+
+    JPEG size grows roughly with the pixel count, so the first guess is taken
+    from that and the rest is a bisection. Returns the closest scale found that
+    does not exceed max_bytes.
+    """
+    target = (min_bytes + max_bytes) / 2
+    size = len(enc.encode(1.0, quality))
+    scale = min(hi, max(lo, (target / size) ** 0.5))
+    best = lo
+
+    for _ in range(8):
+        size = len(enc.encode(scale, quality))
+        if size > max_bytes:
+            hi = scale
+        else:
+            best = scale
+            if size >= min_bytes:
+                break
+            lo = scale
+        scale = (lo + hi) / 2
+
+    return best
+
+
+def compress_to_target(img: Image.Image, min_bytes: int = MIN_SIZE, max_bytes: int = MAX_SIZE) -> tuple[bytes, dict]:
+    """
+    JPEG bytes between min_bytes and max_bytes where possible, at the best quality and
+    resolution that fit. Returns the bytes and what was chosen.
+    """
+    enc = Encoder(img)
+    scale = 1.0
+    quality = best_quality(enc, scale, max_bytes)
+
+    if quality is None:
+        # too big even at the lowest quality: shrink until it fits at a reasonable quality
+        quality = (MIN_QUALITY + MAX_QUALITY) // 2
+        scale = find_scale(enc, quality, min_bytes, max_bytes, 0.05, 1.0)
+
+    elif quality == MAX_QUALITY and len(enc.encode(scale, quality)) < min_bytes:
+        # too small even at the best quality: upscale, as the portal also rejects tiny files
+        scale = find_scale(enc, quality, min_bytes, max_bytes, 1.0, MAX_UPSCALE)
+
+    data = enc.encode(scale, quality)
+    info = {
+        "width": max(1, round(enc.img.width * scale)),
+        "height": max(1, round(enc.img.height * scale)),
+        "scale": round(scale, 3),
+        "quality": quality,
+        "bytes": len(data),
+        "in_range": min_bytes <= len(data) <= max_bytes,
+        "attempts": enc.attempts,
+    }
+    return data, info
+
+
+def process_image(raw: bytes, filter_name: str | None = None,
+                  min_bytes: int = MIN_SIZE, max_bytes: int = MAX_SIZE) -> tuple[bytes, dict]:
+    """
+    Decodes raw (through the image intake limits), applies an optional
+    filter ("scan" / "enhance") and compresses it into the target range.
+    """
+    img = flatten(ImageOps.exif_transpose(decode(raw, formats=IMAGE_FORMATS)))
+
+    if filter_name:
+        img = FILTERS[filter_name](img)
+
+    return compress_to_target(img, min_bytes, max_bytes)
+
+
+#                                                                                --- UPLOAD PATH ---
+
+
+def intake_documents(documents: StoredDocumentUploads, settings: dict | None = None) -> StoredDocumentUploads:
+    """
+    Returns documents with every image scan processed per the [documents] section.
+    PDFs and, when compression is off, everything else is returned unchanged.
+    """
+    settings = settings or read_intake_settings()
+    if not settings["compress"]:
+        return documents
+
+    processed = {}
+    for key, doc in documents:
+        if doc.type not in ("image/png", "image/jpeg"):
+            processed[key] = doc
+            continue
+
+        raw = base64.b64decode(doc.base64.split(",", 1)[1])
+        data, _ = process_image(raw, settings["filter"], settings["min_kb"] * 1024, settings["max_kb"] * 1024)
+
+        processed[key] = StoredDocument(
+            name=os.path.splitext(doc.name)[0] + ".jpg",
+            type="image/jpeg",
+            base64="data:image/jpeg;base64," + base64.b64encode(data).decode("ascii"),
+            preview=None,
+        )
+
+    return StoredDocumentUploads(**processed)
+
+
+#                                                                                --- BATCH CLI ---
+
+
+def safe_filename(name: str) -> str:
+    name = name.strip().rstrip(".")          # no trailing spaces or dots
+    name = re.sub(r'[<>:"/\\|?*]', "_", name) # illegal Windows chars
+    return name
+
+
+def process_file(in_path: str, out_path: str, filter_name: str | None, min_bytes: int, max_bytes: int) -> dict:
+    with open(in_path, "rb") as f:
+        raw = f.read()
+
+    started = time.perf_counter()
+    data, info = process_image(raw, filter_name, min_bytes, max_bytes)
+
+    with open(out_path, "wb") as f:
+        f.write(data)
+
+    return {**info, "file": os.path.basename(in_path), "ms": round((time.perf_counter() - started) * 1000)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scan-filter and compress a folder of document images to 50-100 KB JPEGs")
+    parser.add_argument("folder", help="folder containing images")
+    parser.add_argument("--out", help="output folder (default: <folder>/output_images)")
+    parser.add_argument("--filter", choices=sorted(FILTERS), help="scan effect to apply")
+    parser.add_argument("--min-kb", type=int, default=MIN_SIZE // 1024)
+    parser.add_argument("--max-kb", type=int, default=MAX_SIZE // 1024)
+    parser.add_argument("--workers", type=int, default=None, help="parallel processes")
+    args = parser.parse_args()
+
+    out_dir = args.out or os.path.join(args.folder, "output_images")
+    os.makedirs(out_dir, exist_ok=True)
+
+    files = sorted(f for f in os.listdir(args.folder) if f.lower().endswith(IMAGE_EXTENSIONS))
+    if not files:
+        print(f"❌ No images found in {args.folder}")
+        return
+
+    jobs = [
+        (os.path.join(args.folder, f), os.path.join(out_dir, safe_filename(Path(f).stem) + ".jpg"),
+         args.filter, args.min_kb * 1024, args.max_kb * 1024)
+        for f in files
+    ]
+
+    started = time.time()
+    done = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(process_file, *job) for job in jobs]
+        for job, future in zip(jobs, futures):
+            try:
+                r = future.result()
+            except Exception as e:
+                print(f"❌ {os.path.basename(job[0])}: {e}")
+                continue
+
+            done += 1
+            mark = "✅" if r["in_range"] else "⚠️"
+            print(f"{mark} {r['file']}: {r['width']}x{r['height']}, q{r['quality']}, {r['bytes'] // 1024} KB ({r['attempts']} encodes, {r['ms']} ms)")
+
+    elapsed = time.time() - started
+    print(f"✅ {done} of {len(files)} images in {elapsed:.1f}s ({done / elapsed:.1f} images/s) → {out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,11 +2,31 @@ import json
 import os
 import pandas as pd
 
+from backend.storage import LocalStorage, Storage
+
 
 
 # pyinstaller ./json_to_excel.py --onefile --noconsole --distpath . --workpath .\build --specpath .
 
 
+# Column order of the Excel summary (also used for the mail digest table)
+COLUMN_ORDER = [
+    "Member Name",
+    "Date of Birth",
+    "Mobile Number",
+    "UAN",
+    "Bank Acc. No.",
+    "Bank IFSC",
+    "Father / Husband Name",
+    "PF Account Number",
+    "Nominee 1 Name",
+    "Nominee 1 DOB",
+    "Nominee 1 Relationship",
+    "Nominee 2 Name",
+    "Nominee 2 DOB",
+    "Nominee 2 Relationship",
+]
+
 
 def extract_row(payload: dict) -> dict:
     f2 = payload["forms"]["form_2"]
@@ -54,6 +74,15 @@ def combine_json_to_excel(input_dir: str, output_file: str):
         print(f"❌ Input path is not a directory: {input_dir}")
         return False
 
+    # the submissions only: PDF/, TSV/, archive/ are not walked
+    return combine_storage_to_excel(LocalStorage(input_dir), output_file, recursive=False)
+
+
+def combine_storage_to_excel(storage: Storage, output_file: str, prefix: str = "", recursive: bool = True):
+    """
+    Excel summary of every submission JSON in storage (under prefix),
+    e.g. of all sites in the shared storage.
+    """
     # --- ensure output directory exists ---
     output_dir = os.path.dirname(output_file)
     if output_dir:
@@ -61,17 +90,14 @@ def combine_json_to_excel(input_dir: str, output_file: str):
 
     rows = []
 
-    for filename in os.listdir(input_dir):
-        if not filename.lower().endswith(".json"):
+    for key in storage.keys(prefix, recursive=recursive):
+        if not key.lower().endswith(".json"):
             continue
 
-        file_path = os.path.join(input_dir, filename)
-
         try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                payload = json.load(f)
+            payload = storage.get_json(key)
         except Exception as e:
-            print(f"⚠️ Skipping invalid JSON: {filename} ({e})")
+            print(f"⚠️ Skipping invalid JSON: {key} ({e})")
             continue
 
         rows.append(extract_row(payload))
@@ -83,23 +109,6 @@ def combine_json_to_excel(input_dir: str, output_file: str):
     df = pd.DataFrame(rows)
 
     # Ensure column order (very important)
-    COLUMN_ORDER = [
-        "Member Name",
-        "Date of Birth",
-        "Mobile Number",
-        "UAN",
-        "Bank Acc. No.",
-        "Bank IFSC",
-        "Father / Husband Name",
-        "PF Account Number",
-        "Nominee 1 Name",
-        "Nominee 1 DOB",
-        "Nominee 1 Relationship",
-        "Nominee 2 Name",
-        "Nominee 2 DOB",
-        "Nominee 2 Relationship",
-    ]
-
     df = df.reindex(columns=COLUMN_ORDER, fill_value="")
 
     df.to_excel(output_file, index=False)
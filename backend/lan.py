@@ -0,0 +1,96 @@
+import hashlib
+import io
+import socket
+import threading
+
+import qrcode
+
+
+# The address phones on the LAN use to reach the form, and its QR code.
+#
+# Found once at startup and re-checked in the background, so /admin/pass never
+# touches the network. The QR PNG is rendered once per address and kept in
+# memory: it is served with an ETag and needs no internet access (unlike a QR
+# drawn by a web service), so a kiosk keeps showing it offline.
+
+
+PORT = 8000
+REFRESH_INTERVAL = 30   # seconds between checks for a changed address (Wi-Fi switch, new DHCP lease)
+
+
+def get_local_ip() -> str:
+    # connecting a UDP socket sends nothing: it only asks the OS which interface routes to the LAN
+    s = None
+    try:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.connect(("192.168.1.1", 1))
+        return s.getsockname()[0]
+    except OSError:
+        return "127.0.0.1"
+    finally:
+        if s is not None:
+            s.close()
+
+
+def render_qr(url: str) -> bytes:
+    buffer = io.BytesIO()
+    qrcode.make(url).save(buffer)
+    return buffer.getvalue()
+
+
+class LanAddress:
+    def __init__(self, port: int = PORT, refresh_interval: float = REFRESH_INTERVAL, on_change=None):
+        self.port = port
+        self.refresh_interval = refresh_interval
+        self.on_change = on_change   # (url) -> None, after the address changed
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.ip = None
+        self.qr_png = b""
+        self.qr_etag = ""
+
+    @property
+    def host(self) -> str:
+        return f"{self.ip}:{self.port}"
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}"
+
+    def refresh(self) -> bool:
+        """
+        Looks the address up again. Returns True (and re-renders the QR code) if it changed.
+        """
+        ip = get_local_ip()
+        if ip == self.ip:
+            return False
+
+        url = f"http://{ip}:{self.port}"
+        png = render_qr(url)
+        with self._lock:
+            self.ip = ip
+            self.qr_png = png
+            self.qr_etag = f'"{hashlib.sha256(png).hexdigest()[:16]}"'
+
+        print(f"Local URL: {url}")
+        return True
+
+    def qr(self) -> tuple[bytes, str]:
+        with self._lock:
+            return self.qr_png, self.qr_etag
+
+    def _run(self):
+        while not self._stop.wait(self.refresh_interval):
+            if self.refresh() and self.on_change is not None:
+                self.on_change(self.url)
+
+    def start(self):
+        """
+        Looks the address up, then keeps checking it in the background.
+        """
+        if self._thread is None:
+            self.refresh()
+            self._thread = threading.Thread(target=self._run, name="lan-address", daemon=True)
+            self._thread.start()
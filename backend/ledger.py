@@ -0,0 +1,44 @@
+from datetime import datetime
+import os
+import threading
+
+from backend.atomic import FileLock, committer
+from backend.pdf_utils.pdf_utils import TSV_HEADERS
+
+
+# Day-level TSV ledger: output/TSV/PF_<dd-mm-yyyy>.tsv, one header and one row per submission.
+# A new file is started every day, so a day's submissions can be copied into HR in one go.
+#
+# Appends are serialised by a thread lock (the server) and a lock file (bulk import
+# renders in several processes), and each row is written with a single write call.
+
+
+_lock = threading.Lock()
+
+
+def ledger_path(output_dir, when: datetime | None = None) -> str:
+    when = when or datetime.now()
+    return os.path.join(output_dir, "TSV", f"PF_{when.strftime('%d-%m-%Y')}.tsv")
+
+
+def append_row(output_dir, row: str, when: datetime | None = None) -> str:
+    """
+    Appends one TSV row to the ledger of the day, writing the header first
+    if the file is new. Returns the ledger path.
+    """
+    path = ledger_path(output_dir, when)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with _lock, FileLock(os.path.join(os.path.dirname(path), ".ledger.lock")):
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+
+        text = row.rstrip("\r\n") + "\n"
+        if new_file:
+            text = "\t".join(TSV_HEADERS) + "\n" + text
+
+        # utf-8-sig: the BOM (only written at the start of the file) lets Excel read non-ASCII names
+        with open(path, "a", encoding="utf-8-sig", newline="") as f:
+            f.write(text)
+            committer.sync(f)
+
+    return path
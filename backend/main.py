@@ -1,25 +1,36 @@
-import asyncio
+from contextlib import asynccontextmanager
 from datetime import datetime
-import json
 import os
 from pathlib import Path
 import secrets
 import signal
-import socket
 import sys
+import tempfile
 import threading
 import time
-from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect, status, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Request, WebSocket, status, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
-import qrcode
-from backend.pdf_utils.send_mail import send_mail
+from backend.outbox import OUTBOX_FILE, MailOutbox, read_outbox_settings
 from backend.models import Payload
-from backend.pdf_utils.pdf_utils import form2_to_tsv, generate_merged_forms, readDefaults
+from backend.pdf_utils.pdf_utils import readDefaults
+from backend.submissions import store_submission
+from backend.bulk_import import import_sheet
 from fastapi.middleware.cors import CORSMiddleware
 from backend.json_to_excel import combine_json_to_excel
-from starlette.exceptions import HTTPException as StarletteHTTPException
+from backend.pdf_fields import sync_fields
+from backend.admission import AdmissionController, AdmissionMiddleware, SubmissionGateMiddleware, read_limits
+from backend.preview import THUMBNAIL_WIDTH, PreviewCache, first_page, pdf_response, thumbnail, thumbnail_width, thumbnails_available
+from backend.static_files import SPAStaticFiles
+from backend.heartbeat import HeartbeatMonitor
+from backend.lan import LanAddress
+from backend.atomic import cleanup_temp, committer
+from backend.archival import archive_old, read_archived, start_archiver
+from backend.render_cache import CACHE_DIR, render_cache
+from backend.pdf_utils.images import ImageRejected, decode_stats
+from backend.pdf_utils.templates import templates
+from backend.storage import Replicator, open_storage, read_storage_settings
 
 
 
@@ -46,7 +57,44 @@ EXCEL_OUTPUT_FILE = os.path.join(BASE_DIR,"output", f"{DATE_NAME}.xlsx")
 OUTPUT_DIR = Path.cwd() / "output"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-app = FastAPI()
+# mails of submissions, delivered (and retried) in the background
+outbox = MailOutbox(str(OUTPUT_DIR / OUTBOX_FILE), **read_outbox_settings())
+
+# copies of the submissions in shared storage, see [storage] in config.ini
+storage_settings = read_storage_settings()
+try:
+    shared_storage = open_storage(storage_settings)
+except (ValueError, RuntimeError) as e:
+    print(f"⚠️ Shared storage disabled: {e}")
+    shared_storage = None
+replicator = Replicator(shared_storage, storage_settings["site"], str(OUTPUT_DIR)) if shared_storage else None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Background services start with the server, not on import: a process that only
+    imports this module must never run a second outbox, archiver, ...
+    """
+    # temp files of writes interrupted by a crash / kill
+    for folder in (OUTPUT_DIR, OUTPUT_DIR / "PDF", OUTPUT_DIR / CACHE_DIR):
+        cleanup_temp(str(folder))
+
+    # moves old submissions into output/archive, see [archive] in config.ini
+    start_archiver(str(OUTPUT_DIR))
+
+    # form template of new submissions, see [templates] in config.ini
+    templates.current()
+
+    outbox.start()
+    if replicator:
+        replicator.start()
+    lan.start()
+
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
 
 defaults = readDefaults()
 show_preview = defaults.get("show_preview", False)
@@ -60,69 +108,65 @@ print("# show_preview = ", show_preview, "\nSubmitted form will be sent back to
 print("# Default password not set. Using random password. To set a default password, edit config.ini and set a value to the password field.\nChanges will reflect on restarting the server." if not password else f"# Default password set to: {password}\nTo change, edit config.ini and change the value of password field.\nChanges will reflect on restarting the server.\n\n")
 
 
+admission = AdmissionController.from_config()
+app.add_middleware(AdmissionMiddleware, controller=admission)
+
+# runs before admission, so rejected requests never take a slot
+app.add_middleware(SubmissionGateMiddleware, max_bytes=read_limits()["max_payload_mb"] * 1024 * 1024)
+
+previews = PreviewCache(max_bytes=read_limits()["preview_cache_mb"] * 1024 * 1024)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origin_regex=r"http://(localhost|127\.0\.0\.1|192\.168\.\d+\.\d+|10\.\d+\.\d+\.\d+):\d+",
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
-    expose_headers=["X-Filename"],
+    expose_headers=["X-Filename", "X-Preview-URL", "X-Preview-Page-URL", "X-Thumbnail-URL", "Retry-After"],
 )
 
 
 
+@app.exception_handler(ImageRejected)
+def image_rejected(request: Request, exc: ImageRejected):
+    print(f"🔴 Submission rejected: {exc}")
+    return JSONResponse({"detail": str(exc)}, status_code=413)
+
+
 @app.post("/api/forms/process", status_code=status.HTTP_200_OK)
-def process_forms(payload: Payload, background_tasks: BackgroundTasks, request: Request):
+def process_forms(payload: Payload, request: Request):
     # Validate password
     
     member_name = payload.forms.form_11.personal_details.member_name
     
-    if payload.password != request.app.state.SUBMISSION_PASSWORD:
+    supplied_password = request.headers.get("X-Submission-Password", payload.password)
+
+    if supplied_password != request.app.state.SUBMISSION_PASSWORD:
         print(f"🔴 Submission attempt by {member_name} blocked: Invalid password")
         raise HTTPException(status_code=401, detail="Invalid password")
-    
-    forms = payload.forms
-    docs = payload.documents
-    
-    
-    uan = forms.form_11.previous_employment.uan or ""
-    dob = forms.form_11.personal_details.date_of_birth
-    
-    # Sanitize filename
-    safe_name = "".join(c for c in member_name if c.isalnum() or c in (' ', '-', '_')).strip().upper()
-    safe_uan = "".join(c for c in uan if c.isalnum()).strip()
-    safe_dob = "".join(c for c in str(dob))
-    
-    base_filename = f"{safe_name}_{safe_dob}" if safe_dob else safe_name
-    
-    # Ensure output folders exist
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-    os.makedirs(os.path.join(OUTPUT_DIR, "TSV"), exist_ok=True)
-    os.makedirs(os.path.join(OUTPUT_DIR, "PDF"), exist_ok=True)
-    
-    # Save TSV file
-    tsv_path = os.path.join(OUTPUT_DIR, "TSV", f"{base_filename}.tsv")
-    with open(tsv_path, "w", encoding="utf-8") as f:
-        f.write(form2_to_tsv(payload.forms))
-        
-    # Save JSON file
-    
-    json_path = os.path.join(OUTPUT_DIR, f"{base_filename}.json")
 
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(payload.model_dump(), f, indent=2, default=str)
-    
-    # Generate PDF
-    pdf_path = os.path.join(OUTPUT_DIR, "PDF", f"{base_filename}.pdf")
-    generate_merged_forms(pdf_path, forms, docs)
+    publish_event("submission", name=member_name)
+    try:
+        stored = store_submission(payload, OUTPUT_DIR)
+    except Exception as e:
+        publish_event("render_failed", name=member_name, error=str(e))
+        raise
+    safe_name = stored["safe_name"]
+    safe_uan = stored["safe_uan"]
+    base_filename = stored["base_filename"]
+    pdf_path = stored["pdf_path"]
+    pdf_bytes = stored["pdf_bytes"]
+    publish_event("rendered", name=safe_name, file=f"{base_filename}.pdf", ms=round(stored["render_ms"]), bytes=len(pdf_bytes))
+
+    if replicator:
+        replicator.upload(base_filename)
 
 
-    # Send mail
+    # Send mail (queued, delivered by the outbox thread)
 
-    background_tasks.add_task(
-        send_mail,
+    outbox.enqueue(
         name = safe_name,
-        UAN = safe_uan,
+        uan = safe_uan,
         attachment_path = pdf_path,
     )
     
@@ -131,14 +175,57 @@ def process_forms(payload: Payload, background_tasks: BackgroundTasks, request:
     if not show_preview:
         return JSONResponse({"ok":True, "preview":False})
     
-    return FileResponse(
-        pdf_path,
-        media_type="application/pdf",
-        filename=f"{base_filename}.pdf",
-        headers={
-            "X-Filename": f"{base_filename}.pdf",
-        },
+    # Serve the bytes just rendered, and keep them at a stable URL for re-opens / resumes
+    token = previews.put(pdf_bytes, f"{base_filename}.pdf")
+
+    headers = {
+        "X-Filename": f"{base_filename}.pdf",
+        "X-Preview-URL": f"/api/forms/preview/{token}",
+        "X-Preview-Page-URL": f"/api/forms/preview/{token}/page1",
+    }
+    if thumbnails_available:
+        headers["X-Thumbnail-URL"] = f"/api/forms/preview/{token}/thumbnail"
+
+    return pdf_response(
+        request,
+        previews.get(token),
+        disposition="attachment",
+        headers=headers,
     )
+
+
+@app.api_route("/api/forms/preview/{token}", methods=["GET", "HEAD"])
+def get_preview(token: str, request: Request):
+    entry = previews.get(token)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Preview expired")
+
+    return pdf_response(request, entry)
+
+
+@app.api_route("/api/forms/preview/{token}/page1", methods=["GET", "HEAD"])
+def get_preview_page1(token: str, request: Request):
+    """
+    Form 11 page only: a fraction of the full preview, for a quick check on a phone.
+    """
+    entry = previews.derive(token, "page1", first_page)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Preview expired")
+
+    return pdf_response(request, entry)
+
+
+@app.api_route("/api/forms/preview/{token}/thumbnail", methods=["GET", "HEAD"])
+def get_preview_thumbnail(token: str, request: Request, width: int = THUMBNAIL_WIDTH):
+    if not thumbnails_available:
+        raise HTTPException(status_code=501, detail="Thumbnails are not available on this server")
+
+    width = thumbnail_width(width)
+    entry = previews.derive(token, f"thumbnail_{width}", lambda e: thumbnail(e, width))
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Preview expired")
+
+    return pdf_response(request, entry)
     
 
 def require_admin(request: Request):
@@ -147,46 +234,49 @@ def require_admin(request: Request):
     
     
 
-frontend_connected = False
-last_seen = None
-KILL_AFTER = 15  # seconds
+def frontend_gone():
+    print("❌ Frontend gone, shutting down")
+    threading.Thread(
+        target=delayed_kill,
+        args=(1.0,),
+        daemon=True,
+    ).start()
 
 
-@app.websocket("/ws/heartbeat")
-async def heartbeat_ws(ws: WebSocket):
-    global frontend_connected, last_seen
+def queue_depth() -> dict:
+    counts = outbox.counts()
+    return {
+        "rendering": admission.stats()["in_flight"],
+        "mail_pending": counts.get("pending", 0) + counts.get("sending", 0),
+        "mail_dead": counts.get("dead", 0),
+    }
 
-    if ws.cookies.get("admin_session") != "1":
-        await ws.close(code=4401)
-        return
 
-    await ws.accept()
+heartbeat = HeartbeatMonitor(on_expire=frontend_gone, snapshot=lambda: {"queue": queue_depth()})
 
-    frontend_connected = True
-    last_seen = time.time()
-    print("🟢 Frontend connected")
 
-    try:
-        while True:
-            msg = await ws.receive_text()  # blocks (good)
-            if msg == "ping":
-                last_seen = time.time()
-    except WebSocketDisconnect:
-        frontend_connected = False
-        last_seen = time.time()
-        print("🔴 Frontend disconnected")
+def publish_event(type: str, **fields):
+    """
+    Pushes a server event, with the current queue depth, to the connected admin pages.
+    """
+    if heartbeat.connections:
+        heartbeat.publish({"type": type, **fields, "queue": queue_depth()})
+
 
-async def ws_watchdog():
-    global frontend_connected, last_seen
+# mail sends / failures go to the admin pages too
+outbox.on_event = lambda event: publish_event(**event)
 
-    while True:
-        await asyncio.sleep(2)
+# LAN address of the form and its QR code, re-checked in the background (started by lifespan)
+lan = LanAddress(on_change=lambda url: publish_event("lan_changed", ip=lan.host, url=url))
+
+
+@app.websocket("/ws/heartbeat")
+async def heartbeat_ws(ws: WebSocket):
+    if ws.cookies.get("admin_session") != "1":
+        await ws.close(code=4401)
+        return
 
-        if not frontend_connected:
-            if last_seen and time.time() - last_seen > KILL_AFTER:
-                print("❌ Frontend gone, shutting down")
-                delayed_kill(1.0)
-                break
+    await heartbeat.serve(ws)
 
 
 
@@ -201,7 +291,7 @@ def serve_admin(request: Request, token: str | None = None):
         # consume OTA
         request.app.state.ONE_TIME_ADMIN_TOKEN = None
 
-        response = FileResponse(resource_path("dist/index.html"))
+        response = spa_files.index_response(request.scope)
         response.set_cookie(
             "admin_session",
             "1",
@@ -218,50 +308,40 @@ def serve_admin(request: Request, token: str | None = None):
         print("Admin page accessed. If not you, CTRL C to terminate the server.")
         show_preview = readDefaults().get("show_preview", False)
         print("\n\n# show_preview = ", show_preview, "\nSubmitted form will be sent back to the user as a preview. \nTo disable this, edit config.ini and set show_preview = False and refresh the admin page\n\n" if show_preview else "\nSubmitted forms will not be sent back as a preview.\nTo enable preview, edit config.ini and set show_preview = True and refresh the admin page\n\n")
-        return FileResponse(resource_path("dist/index.html"))
+        return spa_files.index_response(request.scope)
 
     # 3️⃣ Deny everything else
-    return FileResponse(
-            resource_path("dist/index.html"),
+    return spa_files.index_response(
+            request.scope,
             status_code=403,   # 👈 key line
         )
 
     
 
 
-def get_local_ip():
-    try:
-        # try LAN gateway-like address
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.connect(("192.168.1.1", 1))
-        return s.getsockname()[0]
-    except OSError:
-        return "127.0.0.1"
-    finally:
-        s.close()
-
-def generate_qr(url: str, output_path: Path):
-    img = qrcode.make(url)
-    img.save(output_path)
-
 @app.post("/admin/pass")
 def admin_pass(request: Request):
     require_admin(request)
 
-    ip = get_local_ip()
-    port = 8000
-    
-    APP_URL = f"http://{ip}:{port}"
-    QR_PATH = Path("qr.png")
-
-    print(f"Local URL: http://{ip}:{port}")
-
     return JSONResponse({
         "pass": getattr(request.app.state, "SUBMISSION_PASSWORD", SUBMISSION_PASSWORD),
-        "ip": f"{ip}:{port}",
+        "ip": lan.host,
     })
 
 
+@app.get("/api/qr.png")
+def qr_code(request: Request):
+    """
+    QR code of the form's LAN address, rendered once per address.
+    """
+    png, etag = lan.qr()
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}   # revalidated, so a changed address shows at once
+
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(png, media_type="image/png", headers=headers)
+
+
 
 @app.post("/admin/setpass")
 def set_pass(request: Request, body: SetPassBody):
@@ -318,6 +398,17 @@ def json_to_excel(request:Request):
 
     require_admin(request)
 
+    # pick up the PF / employee numbers HR has filled into the PDFs since.
+    # In this process: only changed PDFs are read, and a worker pool per click costs more than it saves
+    synced = sync_fields(JSON_INPUT_DIR, workers=1)
+    for error in synced["errors"]:
+        print(f"⚠️ Could not read PDF fields of {error['name']}: {error['error']}")
+
+    # the shared copies of corrected submissions are replaced too
+    if replicator:
+        for name in synced["names"]:
+            replicator.upload(name)
+
     ok = combine_json_to_excel(JSON_INPUT_DIR, EXCEL_OUTPUT_FILE)
 
     if not ok:
@@ -325,6 +416,132 @@ def json_to_excel(request:Request):
     return {"ok": True}
 
 
+@app.post("/admin/import")
+async def bulk_import(request: Request, kind: str = "xlsx", docs_dir: str | None = None):
+    """
+    Raw .csv / .xlsx body. Every valid row becomes a normal submission in OUTPUT_DIR;
+    invalid rows are reported back with their row number.
+    """
+    require_admin(request)
+
+    if kind not in ("csv", "xlsx"):
+        raise HTTPException(status_code=400, detail="kind must be csv or xlsx")
+    if docs_dir and not os.path.isdir(docs_dir):
+        raise HTTPException(status_code=400, detail=f"Documents folder not found: {docs_dir}")
+
+    # spill large sheets to disk instead of holding them in memory
+    sheet = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    try:
+        async for chunk in request.stream():
+            sheet.write(chunk)
+        sheet.seek(0)
+
+        report = await run_in_threadpool(import_sheet, sheet, kind, str(OUTPUT_DIR), docs_dir)
+    finally:
+        sheet.close()
+
+    print(f"📥 Bulk import: {len(report['imported'])} of {report['rows']} rows imported in {report['seconds']}s")
+
+    # re-imports replace their earlier shared copies, so every imported name is uploaded
+    if replicator:
+        for name in report["imported"]:
+            replicator.upload(name)
+    return JSONResponse(report)
+
+
+@app.post("/admin/archive")
+def run_archive(request: Request, days: int | None = None):
+    require_admin(request)
+
+    report = archive_old(str(OUTPUT_DIR), days)
+    print(f"🗄️ Archived {report['removed']} old files in {report['seconds']}s")
+    return JSONResponse(report)
+
+
+@app.get("/admin/archive/{name}")
+def get_archived(name: str, request: Request):
+    """Stored JSON of an archived submission, for corrections / regeneration."""
+    require_admin(request)
+
+    data = read_archived(str(OUTPUT_DIR), name)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Not found in the archive")
+
+    return Response(content=data, media_type="application/json")
+
+
+@app.get("/admin/templates")
+def list_templates(request: Request):
+    require_admin(request)
+
+    return JSONResponse(templates.stats())
+
+
+@app.post("/admin/templates/{version}")
+def activate_template(version: str, request: Request):
+    """
+    Switches new submissions to another template version, without a restart.
+    Submissions being rendered finish on the version they started with.
+    """
+    require_admin(request)
+
+    try:
+        template = templates.activate(version)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"No template {version} in {templates.directory}")
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Template {version} could not be loaded: {e}")
+
+    return JSONResponse({"ok": True, "active": template.version})
+
+
+@app.get("/admin/outbox")
+def list_outbox(request: Request):
+    """
+    Mails waiting to be sent (or retried) and mails that failed for good.
+    """
+    require_admin(request)
+
+    return JSONResponse(outbox.overview())
+
+
+@app.post("/admin/outbox/{mail_id}/retry")
+def retry_mail(mail_id: int, request: Request):
+    require_admin(request)
+
+    if not outbox.retry(mail_id):
+        raise HTTPException(status_code=404, detail="No failed mail with this id")
+    return JSONResponse({"ok": True})
+
+
+@app.post("/admin/outbox/flush")
+def flush_outbox(request: Request):
+    """
+    Sends the mails held back for the digest now, without waiting for digest_minutes.
+    """
+    require_admin(request)
+
+    outbox.flush()
+    return JSONResponse({"ok": True, "counts": outbox.counts()})
+
+
+@app.get("/admin/stats")
+def admin_stats(request: Request):
+    require_admin(request)
+
+    return JSONResponse({
+        "admission": admission.stats(),
+        "previews": previews.stats(),
+        "heartbeat": heartbeat.stats(),
+        "fsync": committer.stats(),
+        "images": decode_stats.snapshot(),
+        "render_cache": cache.stats() if (cache := render_cache(str(OUTPUT_DIR))) else None,
+        "templates": templates.stats(),
+        "outbox": outbox.counts(),
+        "storage": replicator.stats() if replicator else None,
+    })
+
+
 @app.get("/isAdmin")
 def is_admin(request: Request):
     """Check if the current user has admin privileges via cookie."""
@@ -352,18 +569,6 @@ def get_OTA():
     return os.getenv("ONE_TIME_ADMIN_TOKEN")
 
 
-class SPAStaticFiles(StaticFiles):
-    async def get_response(self, path: str, scope):
-        try:
-            return await super().get_response(path, scope)
-        except StarletteHTTPException as ex:
-            if ex.status_code == 404:
-                return await super().get_response("index.html", scope)
-            raise ex
-
-app.mount("/", SPAStaticFiles(directory=resource_path("dist"), html=True), name="spa-static-files")
-
+spa_files = SPAStaticFiles(directory=resource_path("dist"), html=True)
 
-@app.on_event("startup")
-async def start_watchdog():
-    asyncio.create_task(ws_watchdog())
+app.mount("/", spa_files, name="spa-static-files")
@@ -150,6 +150,7 @@ class FormsPayload(BaseModel):
 class MetaPayload(BaseModel):
     exported_at: str
     version: str
+    template_version: Optional[str] = None   # form template the PDF was rendered with
 
 
 class StoredDocument(BaseModel):
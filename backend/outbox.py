@@ -0,0 +1,341 @@
+from concurrent.futures import ThreadPoolExecutor
+import configparser
+import os
+import random
+import smtplib
+import sqlite3
+import threading
+import time
+
+from backend.pdf_utils.send_mail import CONFIG_PATH, build_digest, build_message, deliver, ensure_config, mail_settings
+
+
+# Mail outbox.
+#
+# Submissions no longer send their mail from the request: they add a row to a
+# SQLite table in the output folder, and a delivery thread sends it. Mails
+# therefore survive /kill, the watchdog and crashes (a mail caught mid-send is
+# sent again on the next start), and a slow or unreachable SMTP server only
+# delays the outbox, never a submission.
+#
+# Failed sends are retried with exponential backoff and jitter. After
+# max_attempts - or at once, for errors a retry cannot fix - a mail is marked
+# dead and kept for the admin to look at and retry.
+#
+# In digest mode the queued mails are held back and sent together, as one mail
+# with all their PDFs: once the oldest has waited digest_minutes, or once their
+# PDFs add up to digest_max_mb (the most a relay will take in one mail).
+
+
+OUTBOX_FILE = ".outbox.sqlite3"
+
+RETRY_BASE = 30             # seconds before the first retry, doubled each time
+RETRY_MAX = 60 * 60         # longest wait between two attempts
+POLL_INTERVAL = 15          # longest sleep of the delivery thread
+KEEP_SENT_DAYS = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS mails (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT,
+    uan TEXT,
+    attachment_path TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',   -- pending / sending / sent / dead
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    sent_at REAL
+);
+CREATE INDEX IF NOT EXISTS mails_due ON mails (status, next_attempt_at);
+"""
+
+# errors that will fail again on every retry
+PERMANENT_ERRORS = (FileNotFoundError, IsADirectoryError, smtplib.SMTPAuthenticationError, smtplib.SMTPRecipientsRefused)
+
+
+def read_outbox_settings():
+    try:
+        ensure_config()
+    except RuntimeError as e:
+        print(e)
+
+    cfg = configparser.ConfigParser()
+    cfg.read(CONFIG_PATH, encoding="utf-8")
+
+    digest = cfg.getboolean("mail", "digest", fallback=False)
+    return {
+        "workers": max(1, cfg.getint("mail", "mail_workers", fallback=2)),
+        "max_attempts": max(1, cfg.getint("mail", "max_attempts", fallback=6)),
+        "digest_minutes": max(1, cfg.getint("mail", "digest_minutes", fallback=60)) if digest else 0,
+        "digest_max_mb": max(1, cfg.getint("mail", "digest_max_mb", fallback=20)),
+        "digest_zip": cfg.getboolean("mail", "digest_zip", fallback=False),
+    }
+
+
+def attachment_size(path: str | None) -> int:
+    try:
+        return os.path.getsize(path) if path else 0
+    except OSError:
+        return 0
+
+
+def retry_delay(attempts: int) -> float:
+    # exponential backoff, randomised so mails that failed together do not retry together
+    delay = min(RETRY_MAX, RETRY_BASE * 2 ** (attempts - 1))
+    return random.uniform(delay / 2, delay)
+
+
+class MailOutbox:
+    def __init__(self, path: str, workers: int = 2, max_attempts: int = 6,
+                 digest_minutes: int = 0, digest_max_mb: int = 20, digest_zip: bool = False):
+        self.path = path
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.digest_window = digest_minutes * 60     # 0: one mail per submission
+        self.digest_max_bytes = digest_max_mb * 1024 * 1024
+        self.digest_zip = digest_zip
+        self._flush = False
+        self.on_event = None   # (event dict) -> None, told of every send and failure
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._inflight = 0    # sends running, at most `workers`
+        self._thread: threading.Thread | None = None
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+
+    def _execute(self, sql: str, params=()) -> list[sqlite3.Row]:
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    #                                                                                --- QUEUE ---
+
+    def enqueue(self, name: str | None, uan: str | None, attachment_path: str | None) -> int | None:
+        """
+        Queues the mail of a submission. Returns its id, or None if mailing is off.
+        """
+        if mail_settings() is None:
+            return None
+
+        now = time.time()
+        with self._lock:
+            mail_id = self._db.execute(
+                "INSERT INTO mails (name, uan, attachment_path, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?)",
+                (name, uan, str(attachment_path) if attachment_path else None, now, now),
+            ).lastrowid
+
+        self._wake.set()
+        return mail_id
+
+    def _due(self) -> list[sqlite3.Row]:
+        return self._db.execute(
+            "SELECT * FROM mails WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY created_at",
+            (time.time(),),
+        ).fetchall()
+
+    def _pick(self, due: list[sqlite3.Row]) -> list[sqlite3.Row]:
+        """
+        The mails to send together now: one, or in digest mode, a digest if one is due.
+        """
+        if not due:
+            return []
+        if not self.digest_window:
+            return due[:1]
+
+        batch, size = [], 0
+        for row in due:
+            row_size = attachment_size(row["attachment_path"])
+            if batch and size + row_size > self.digest_max_bytes:
+                return batch   # full: send now, the rest goes in the next digest
+            batch.append(row)
+            size += row_size
+
+        if self._flush or size >= self.digest_max_bytes or time.time() - batch[0]["created_at"] >= self.digest_window:
+            return batch
+        return []
+
+    def _claim(self) -> list[sqlite3.Row]:
+        # BEGIN IMMEDIATE: the rows are picked and marked in one step
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                batch = self._pick(self._due())
+                for row in batch:
+                    self._db.execute("UPDATE mails SET status = 'sending' WHERE id = ?", (row["id"],))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+            if not batch:
+                self._flush = False
+        return batch
+
+    #                                                                                --- DELIVERY ---
+
+    def _notify(self, event: dict):
+        if self.on_event is not None:
+            try:
+                self.on_event(event)
+            except Exception as e:
+                print(f"⚠️ Mail outbox event: {e!r}")
+
+    def _failed(self, rows: list[sqlite3.Row], e: Exception):
+        error = f"{type(e).__name__}: {e}"
+        delay = None
+
+        for row in rows:
+            attempts = row["attempts"] + 1
+            if attempts >= self.max_attempts or isinstance(e, PERMANENT_ERRORS):
+                self._execute(
+                    "UPDATE mails SET status = 'dead', attempts = ?, last_error = ? WHERE id = ?",
+                    (attempts, error, row["id"]),
+                )
+                print(f"❌ Mail for {row['name']} failed for good after {attempts} attempt(s): {error}")
+                self._notify({"type": "mail_failed", "id": row["id"], "name": row["name"], "error": error, "dead": True})
+            else:
+                # the mails of a digest stay together
+                delay = delay or retry_delay(attempts)
+                self._execute(
+                    "UPDATE mails SET status = 'pending', attempts = ?, last_error = ?, next_attempt_at = ? WHERE id = ?",
+                    (attempts, error, time.time() + delay, row["id"]),
+                )
+                print(f"⚠️ Mail for {row['name']} failed ({error}), retrying in {delay:.0f}s")
+                self._notify({"type": "mail_failed", "id": row["id"], "name": row["name"], "error": error,
+                              "dead": False, "retry_in": round(delay)})
+
+    def _sent(self, rows: list[sqlite3.Row]):
+        now = time.time()
+        for row in rows:
+            self._execute(
+                "UPDATE mails SET status = 'sent', attempts = attempts + 1, last_error = NULL, sent_at = ? WHERE id = ?",
+                (now, row["id"]),
+            )
+        self._notify({"type": "mail_sent", "ids": [row["id"] for row in rows], "names": [row["name"] for row in rows]})
+
+    def _send(self, rows: list[sqlite3.Row]):
+        try:
+            cfg = mail_settings()
+            if cfg is None:
+                raise RuntimeError("Mailing is disabled or not set up in config.ini")
+
+            if len(rows) == 1 and not self.digest_window:
+                row = rows[0]
+                msg = build_message(cfg, row["name"], row["uan"], row["attachment_path"])
+            else:
+                # a missing PDF fails its own mail, not the whole digest
+                present = []
+                for row in rows:
+                    if row["attachment_path"] and not os.path.isfile(row["attachment_path"]):
+                        self._failed([row], FileNotFoundError(f"No such file: {row['attachment_path']}"))
+                    else:
+                        present.append(row)
+                rows = present
+                if not rows:
+                    return
+                msg = build_digest(cfg, [dict(row) for row in rows], self.digest_zip)
+
+            deliver(cfg, msg)
+
+        except Exception as e:
+            self._failed(rows, e)
+        else:
+            self._sent(rows)
+            if len(rows) == 1:
+                print(f"📧 Mailed PDF: {os.path.basename(rows[0]['attachment_path'] or '')} ({rows[0]['name']})")
+            else:
+                print(f"📧 Mailed digest of {len(rows)} PDFs")
+        finally:
+            with self._lock:
+                self._inflight -= 1
+            self._wake.set()
+
+    def _wait_time(self) -> float:
+        # until the next retry (or digest) is due, or until woken by a new mail / a finished send
+        with self._lock:
+            if self._inflight >= self.workers:
+                return POLL_INTERVAL
+
+        rows = self._execute(
+            "SELECT MIN(next_attempt_at) AS due, MIN(created_at) AS oldest FROM mails WHERE status = 'pending'"
+        )
+        due = rows[0]["due"] if rows else None
+        if due is None:
+            return POLL_INTERVAL
+        if self.digest_window:
+            due = max(due, rows[0]["oldest"] + self.digest_window)
+        return min(POLL_INTERVAL, max(0.0, due - time.time()))
+
+    def _run(self):
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="mail") as pool:
+            while True:
+                self._wake.wait(self._wait_time())
+                self._wake.clear()
+
+                # at most `workers` SMTP connections at a time
+                while self._inflight < self.workers:
+                    try:
+                        batch = self._claim()
+                    except sqlite3.Error as e:
+                        print(f"⚠️ Mail outbox: {e}")
+                        break
+                    if not batch:
+                        break
+
+                    with self._lock:
+                        self._inflight += 1
+                    pool.submit(self._send, batch)
+
+    def start(self):
+        """
+        Starts the delivery thread. Mails interrupted mid-send by a previous run are sent again.
+        """
+        if self._thread is not None:
+            return
+
+        self._execute("UPDATE mails SET status = 'pending' WHERE status = 'sending'")
+        self._execute("DELETE FROM mails WHERE status = 'sent' AND sent_at < ?", (time.time() - KEEP_SENT_DAYS * 86400,))
+
+        self._thread = threading.Thread(target=self._run, name="mail-outbox", daemon=True)
+        self._thread.start()
+        self._wake.set()
+
+    #                                                                                --- ADMIN ---
+
+    def flush(self):
+        """
+        Sends the mails held for the digest now.
+        """
+        with self._lock:
+            self._flush = True
+        self._wake.set()
+
+    def retry(self, mail_id: int) -> bool:
+        """
+        Puts a dead mail back in the queue, with a fresh set of attempts.
+        """
+        with self._lock:
+            changed = self._db.execute(
+                "UPDATE mails SET status = 'pending', attempts = 0, next_attempt_at = ? WHERE id = ? AND status = 'dead'",
+                (time.time(), mail_id),
+            ).rowcount
+        self._wake.set()
+        return bool(changed)
+
+    def counts(self) -> dict:
+        return {row["status"]: row["n"] for row in self._execute("SELECT status, COUNT(*) AS n FROM mails GROUP BY status")}
+
+    def overview(self, limit: int = 100) -> dict:
+        columns = "id, name, uan, attachment_path, status, attempts, next_attempt_at, last_error, created_at"
+        return {
+            "counts": self.counts(),
+            "pending": [dict(r) for r in self._execute(
+                f"SELECT {columns} FROM mails WHERE status IN ('pending', 'sending') ORDER BY next_attempt_at LIMIT ?", (limit,))],
+            "dead": [dict(r) for r in self._execute(
+                f"SELECT {columns} FROM mails WHERE status = 'dead' ORDER BY created_at DESC LIMIT ?", (limit,))],
+        }
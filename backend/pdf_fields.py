@@ -0,0 +1,202 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+import time
+
+from pypdf import PdfReader
+
+from backend.atomic import atomic_write
+from backend.submissions import names_lock
+
+
+# Reading back the editable fields of generated PDFs.
+#
+# HR fills in the AcroForm fields (PF number, employee number, UAN, ...) after
+# the PDF is generated. read_fields() takes them from the field widgets only -
+# no page content is parsed - and sync_fields() merges them into the submission
+# JSON, the source of truth for the Excel summary:
+#
+#   - every non-empty field is kept as-is under "pdf_fields"
+#   - fields that correspond to a form value overwrite it (FIELD_MAP)
+#
+# PDFs that have not changed since their JSON was last written are skipped.
+#
+#   python -m backend.pdf_fields ./output --workers 4
+
+
+# PDF field -> (form, path in that form). Later entries win when both were changed.
+FIELD_MAP = {
+    "emp_no": ("form_2", ("employee_no",)),
+    "employee_number": ("form_2", ("employee_no",)),
+    "pf_ac_number_f2": ("form_2", ("pf_account_no",)),
+    "uan_f1": ("form_11", ("previous_employment", "uan")),
+    "pf_ac_number_f1": ("form_11", ("previous_employment", "previous_pf_account_no")),
+}
+
+
+def read_fields(pdf_path: str) -> dict[str, str]:
+    """
+    Non-empty field values of a PDF, by field name.
+
+    Read from the widgets on the pages rather than the /AcroForm dictionary,
+    which PDFs generated before it was added do not have.
+    """
+    reader = PdfReader(pdf_path)
+    values = {}
+    for page in reader.pages:
+        for annot in page.get("/Annots") or []:
+            widget = annot.get_object()
+            if widget.get("/Subtype") != "/Widget":
+                continue
+
+            # a field with several widgets keeps its name and value on the parent
+            field = widget["/Parent"].get_object() if "/T" not in widget and "/Parent" in widget else widget
+            name, value = field.get("/T"), field.get("/V")
+            value = str(value).strip() if value is not None else ""
+
+            # the form pages come first: attachments never override their fields
+            if name and value and name not in values:
+                values[str(name)] = value
+    return values
+
+
+def try_read_fields(pdf_path: str) -> dict[str, str] | Exception:
+    try:
+        return read_fields(pdf_path)
+    except Exception as e:
+        return e
+
+
+def apply_fields(stored: dict, values: dict[str, str]) -> bool:
+    """
+    Merges values into a stored submission. Returns True if anything changed.
+    """
+    forms = stored.get("forms") or {}
+    previous = stored.get("pdf_fields")   # as read last time, None until the first read
+    changed = previous != values
+    stored["pdf_fields"] = values
+
+    # a field only counts when HR changed it - since the last read, or on the first
+    # read from the value generated into the PDF - so an untouched copy of the same
+    # value on another page never undoes an edit, now or on a later sync
+    original = {}
+    for field, (form, path) in FIELD_MAP.items():
+        value = values.get(field)
+        target = forms.get(form)
+        if not value or target is None:
+            continue
+
+        *parents, key = path
+        for parent in parents:
+            target = target.get(parent)
+            if target is None:   # e.g. no previous employment: nothing to correct
+                break
+        else:
+            original.setdefault((form, path), target.get(key))
+            before = previous.get(field) if previous is not None else original[(form, path)]
+            if value != before and value != target.get(key):
+                target[key] = value
+                changed = True
+
+    return changed
+
+
+def needs_sync(json_path: str, pdf_path: str) -> bool:
+    try:
+        pdf_mtime = os.path.getmtime(pdf_path)
+        json_mtime = os.path.getmtime(json_path)
+    except OSError:
+        return False
+
+    if pdf_mtime > json_mtime:
+        return True
+
+    # never read yet
+    with open(json_path, "r", encoding="utf-8") as f:
+        return "pdf_fields" not in json.load(f)
+
+
+def find_pairs(output_dir: str) -> list[tuple[str, str, str]]:
+    """
+    (name, json_path, pdf_path) of every submission whose PDF needs reading.
+    """
+    pdf_dir = os.path.join(output_dir, "PDF")
+    pairs = []
+    for filename in sorted(os.listdir(output_dir)):
+        if not filename.lower().endswith(".json"):
+            continue
+
+        name = filename[:-5]
+        json_path = os.path.join(output_dir, filename)
+        pdf_path = os.path.join(pdf_dir, f"{name}.pdf")
+        try:
+            if needs_sync(json_path, pdf_path):
+                pairs.append((name, json_path, pdf_path))
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Skipping invalid JSON: {filename} ({e})")
+    return pairs
+
+
+def merge_into_json(json_path: str, values: dict[str, str]) -> bool:
+    with names_lock(os.path.dirname(json_path)):
+        with open(json_path, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+
+        if not apply_fields(stored, values):
+            return False
+
+        atomic_write(json_path, json.dumps(stored, indent=2, default=str))
+        return True
+
+
+def sync_fields(output_dir: str, workers: int | None = None) -> dict:
+    """
+    Reads the PDF fields of every changed submission in output_dir, in parallel
+    processes unless workers=1 (as the server does), and merges them into the
+    JSON files. "names" lists the submissions updated.
+    """
+    started = time.time()
+    result = {"checked": 0, "updated": 0, "names": [], "errors": []}
+    if not os.path.isdir(output_dir):
+        return result
+
+    pairs = find_pairs(output_dir)
+    result["checked"] = len(pairs)
+
+    if len(pairs) > 1 and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            outcomes = list(pool.map(try_read_fields, [pdf_path for _, _, pdf_path in pairs]))
+    else:
+        outcomes = [try_read_fields(pdf_path) for _, _, pdf_path in pairs]
+
+    for (name, json_path, _), values in zip(pairs, outcomes):
+        if isinstance(values, Exception):
+            result["errors"].append({"name": name, "error": str(values)})
+            continue
+        try:
+            if merge_into_json(json_path, values):
+                result["updated"] += 1
+                result["names"].append(name)
+        except (OSError, ValueError) as e:
+            result["errors"].append({"name": name, "error": str(e)})
+
+    result["seconds"] = round(time.time() - started, 2)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge the fields filled in generated PDFs back into their JSON")
+    parser.add_argument("output_dir", help="output folder (containing the JSON files and PDF/)")
+    parser.add_argument("--workers", type=int, default=None, help="parallel processes")
+    args = parser.parse_args()
+
+    result = sync_fields(args.output_dir, args.workers)
+
+    for error in result["errors"]:
+        print(f"❌ {error['name']}: {error['error']}")
+    print(f"✅ {result['checked']} PDFs read, {result['updated']} submissions updated in {result.get('seconds', 0)}s")
+
+
+if __name__ == "__main__":
+    main()
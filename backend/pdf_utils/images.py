@@ -0,0 +1,154 @@
+from functools import lru_cache
+import io
+import threading
+import time
+
+from PIL import Image
+from reportlab.lib.utils import ImageReader
+
+from backend.admission import read_limits
+
+
+# Intake for uploaded images (document scans and signatures).
+#
+# Every image is checked from its header - byte size, then pixel count - before
+# anything is decoded, so a tiny file claiming 50000 x 50000 pixels is refused
+# without allocating anything. Images are then decoded no larger than they are
+# drawn: JPEGs through the decoder's draft mode (DCT scaling to 1/2, 1/4, 1/8),
+# others by reducing right after decoding. Peak memory per image is therefore
+# bounded by max_image_megapixels, and usually by the target size.
+
+
+# Resolution images are drawn at in the PDF
+TARGET_DPI = 200
+
+
+class ImageRejected(ValueError):
+    """
+    Raised for uploads that are too large, not an image, or in an unsupported format.
+    """
+
+
+@lru_cache(maxsize=1)
+def image_limits() -> dict:
+    limits = read_limits()
+    return {
+        "max_bytes": limits["max_image_mb"] * 1024 * 1024,
+        "max_pixels": limits["max_image_megapixels"] * 1_000_000,
+    }
+
+
+class DecodeStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.decoded = 0
+        self.rejected = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, ms: float):
+        with self._lock:
+            self.decoded += 1
+            self.total_ms += ms
+            self.max_ms = max(self.max_ms, ms)
+
+    def reject(self):
+        with self._lock:
+            self.rejected += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "decoded": self.decoded,
+                "rejected": self.rejected,
+                "avg_ms": round(self.total_ms / self.decoded, 1) if self.decoded else 0,
+                "max_ms": round(self.max_ms, 1),
+            }
+
+
+decode_stats = DecodeStats()
+
+
+def target_pixels(width_pt: float, height_pt: float, dpi: int = TARGET_DPI) -> tuple[int, int]:
+    return max(1, round(width_pt * dpi / 72)), max(1, round(height_pt * dpi / 72))
+
+
+def probe(raw: bytes, formats=("JPEG", "PNG")) -> Image.Image:
+    """
+    Opens raw without decoding it and enforces the byte / pixel limits.
+    """
+    limits = image_limits()
+
+    if len(raw) > limits["max_bytes"]:
+        decode_stats.reject()
+        raise ImageRejected(f"Image is {len(raw) / 1024 / 1024:.1f} MB, the limit is {limits['max_bytes'] // 1024 // 1024} MB")
+
+    try:
+        img = Image.open(io.BytesIO(raw), formats=formats)
+    except Image.DecompressionBombError:
+        decode_stats.reject()
+        raise ImageRejected("Image resolution is too large")
+    except Exception:
+        decode_stats.reject()
+        raise ImageRejected("File is not a supported image")
+
+    w, h = img.size
+    if w * h > limits["max_pixels"]:
+        decode_stats.reject()
+        raise ImageRejected(f"Image is {w}x{h} pixels, the limit is {limits['max_pixels'] // 1_000_000} megapixels")
+
+    return img
+
+
+def _decode(img: Image.Image, target: tuple[int, int] | None, mode: str | None) -> Image.Image:
+    if target and (img.width > target[0] or img.height > target[1]):
+        if img.format == "JPEG":
+            # decoded directly at 1/2, 1/4 or 1/8 scale, never at full size
+            img.draft(mode or img.mode, target)
+        img.thumbnail(target, Image.Resampling.LANCZOS, reducing_gap=2.0)
+    else:
+        img.load()
+
+    if mode and img.mode != mode:
+        img = img.convert(mode)
+    return img
+
+
+def decode(raw: bytes, target: tuple[int, int] | None = None, mode: str | None = None,
+           formats=("JPEG", "PNG")) -> Image.Image:
+    """
+    Decodes raw at no more than target (w, h) pixels, keeping the aspect ratio.
+    """
+    started = time.perf_counter()
+    img = _decode(probe(raw, formats), target, mode)
+    decode_stats.record((time.perf_counter() - started) * 1000)
+    return img
+
+
+def image_reader(raw: bytes, target: tuple[int, int] | None = None) -> tuple[ImageReader, tuple[int, int]]:
+    """
+    ImageReader for drawing raw at no more than target pixels, plus its pixel size.
+
+    JPEGs that already fit are handed to ReportLab untouched, which embeds
+    them as they are instead of re-compressing the pixels. Downscaled JPEGs
+    are re-encoded as JPEG for the same reason.
+    """
+    started = time.perf_counter()
+    img = probe(raw)
+
+    if img.format == "JPEG":
+        if target is None or (img.width <= target[0] and img.height <= target[1]):
+            decode_stats.record((time.perf_counter() - started) * 1000)
+            return ImageReader(io.BytesIO(raw)), img.size
+
+        img = _decode(img, target, "RGB" if img.mode != "L" else None)
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=90)
+        buf.seek(0)
+        result = ImageReader(buf)
+    else:
+        img = _decode(img, target, None)
+        result = ImageReader(img)
+
+    decode_stats.record((time.perf_counter() - started) * 1000)
+    return result, img.size
@@ -0,0 +1,250 @@
+import json
+from functools import lru_cache, partial
+
+from reportlab.lib import colors
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+
+# Form layouts are data (layout.json): coordinates, font rules and wrapping widths (in points).
+# They are compiled once into draw plans - flat lists of ready-to-call steps -
+# which are then run over the prepared fields of each submission.
+
+
+def load_layout(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+@lru_cache(maxsize=8192)
+def unit_width(text: str, font: str) -> float:
+    """
+    Width of text at font size 1. Widths scale linearly with the size,
+    so one cached entry serves every size.
+    """
+    return stringWidth(text, font, 1)
+
+
+def text_width(text: str, font: str, size: float) -> float:
+    return unit_width(text, font) * size
+
+
+def fit_size(text: str, font: str, size: float, max_width: float, min_size: float) -> float:
+    """
+    Largest size <= size at which text fits in max_width, but never below min_size.
+    """
+    width = unit_width(text, font)
+    if width * size <= max_width:
+        return size
+    return max(min_size, max_width / width)
+
+
+def split_word(word: str, font: str, size: float, max_width: float) -> list[str]:
+    # a single word wider than the column is broken at character level
+    parts, current = [], ""
+    for ch in word:
+        if current and text_width(current + ch, font, size) > max_width:
+            parts.append(current)
+            current = ch
+        else:
+            current += ch
+    return parts + [current]
+
+
+def wrap_text(text: str, font: str, size: float, max_width: float, max_lines: int = 3) -> list[str]:
+    """
+    Greedy word wrap using real font metrics.
+    """
+    space = text_width(" ", font, size)
+    lines, current, current_width = [], [], 0.0
+
+    for word in text.split():
+        word_width = text_width(word, font, size)
+
+        if word_width > max_width:
+            pieces = split_word(word, font, size, max_width)
+        else:
+            pieces = [word]
+
+        for piece in pieces:
+            piece_width = word_width if len(pieces) == 1 else text_width(piece, font, size)
+            needed = piece_width if not current else current_width + space + piece_width
+
+            if current and needed > max_width:
+                lines.append(" ".join(current))
+                if len(lines) == max_lines:
+                    return lines
+                current, current_width = [piece], piece_width
+            else:
+                current.append(piece)
+                current_width = needed
+
+    if current:
+        lines.append(" ".join(current))
+    return lines[:max_lines]
+
+
+def normalize_address(addr: str) -> str:
+    return " ".join(addr.replace("\n", " ").split())
+
+
+def lookup(fields, key: str):
+    if isinstance(fields, dict):
+        return fields.get(key)
+    return getattr(fields, key, None)
+
+
+#                                                                                --- DRAW STEPS ---
+# Each step is called as step(c, fields, dy), dy being the offset of the current row.
+
+
+def draw_text(c, fields, dy, *, key, x, y, font, size, upper, shift_per_char, fit):
+    text = lookup(fields, key)
+    if not text:
+        return
+
+    text = str(text)
+    if upper:
+        text = text.upper()
+
+    if fit:
+        size = fit_size(text, font, size, fit["width"], fit["min"])
+
+    c.setFont(font, size)
+    c.drawString(x + shift_per_char * len(text), y + dy, text)
+
+
+def draw_mark(c, fields, dy, *, key, at, font, size, symbol):
+    value = lookup(fields, key)
+    pos = at.get(str(bool(value)).lower())
+    if pos is None:
+        return
+
+    c.setFont(font, size)
+    c.drawString(pos[0], pos[1] + dy, symbol)
+
+
+def draw_lines(c, fields, dy, *, key, x, y, font, size, width, max_lines, line_height, normalize):
+    text = lookup(fields, key)
+    if not text:
+        return
+
+    if normalize:
+        text = normalize_address(text)
+
+    c.setFont(font, size)
+    for i, line in enumerate(wrap_text(text, font, size, width, max_lines)):
+        c.drawString(x, y + dy - (i * line_height), line)
+
+
+def draw_field(c, fields, dy, *, key, value, options):
+    if key:
+        value = lookup(fields, key) or ""
+
+    c.acroForm.textfield(
+        value=str(value),
+        fillColor=colors.transparent,
+        borderColor=colors.transparent,
+        textColor=colors.black,
+        **options,
+    )
+
+
+def draw_signature(c, fields, dy, *, key, x, y, width, height):
+    # the box stands for the whole signature pad, see signature.py
+    signature = lookup(fields, key)
+    if signature:
+        signature.draw(c, x, y + dy, width, height)
+
+
+def draw_rows(c, fields, dy, *, key, y, pitch, limit, plan):
+    items = lookup(fields, key) or []
+    for idx, item in enumerate(items[:limit]):
+        run_plan(c, plan, item, dy + y - (idx * pitch))
+
+
+#                                                                                --- COMPILER ---
+
+
+def compile_step(spec: dict, defaults: dict):
+    kind = spec["type"]
+    font = spec.get("font", defaults["font"])
+    size = spec.get("size", defaults["size"])
+
+    if kind == "text":
+        return partial(
+            draw_text,
+            key=spec["key"], x=spec["x"], y=spec["y"], font=font, size=size,
+            upper=spec.get("upper", False),
+            shift_per_char=spec.get("shift_per_char", 0),
+            fit=spec.get("fit"),
+        )
+
+    if kind == "mark":
+        return partial(
+            draw_mark,
+            key=spec["key"], at=spec["at"], font=font, size=size,
+            symbol=spec.get("symbol", "✔"),
+        )
+
+    if kind == "lines":
+        return partial(
+            draw_lines,
+            key=spec["key"], x=spec["x"], y=spec["y"], font=font, size=size,
+            width=spec["width"], max_lines=spec.get("max_lines", 3),
+            line_height=spec["line_height"], normalize=spec.get("normalize", False),
+        )
+
+    if kind == "field":
+        options = {
+            "name": spec["name"],
+            "tooltip": spec.get("tooltip", ""),
+            "x": spec["x"],
+            "y": spec["y"],
+            "height": spec["height"],
+            "maxlen": spec["maxlen"],
+            "fontSize": spec.get("fontSize", size),
+            "borderWidth": 0,
+            "forceBorder": False,
+        }
+        if "width" in spec:
+            options["width"] = spec["width"]
+
+        return partial(draw_field, key=spec.get("key"), value=spec.get("value", ""), options=options)
+
+    if kind == "signature":
+        return partial(
+            draw_signature,
+            key=spec["key"], x=spec["x"], y=spec["y"],
+            width=spec["width"], height=spec["height"],
+        )
+
+    if kind == "rows":
+        return partial(
+            draw_rows,
+            key=spec["key"], y=spec["y"], pitch=spec["pitch"], limit=spec["max"],
+            plan=compile_plan(spec["items"], defaults),
+        )
+
+    raise ValueError(f"Unknown layout step type: {kind}")
+
+
+def compile_plan(specs: list[dict], defaults: dict) -> tuple:
+    return tuple(compile_step(spec, defaults) for spec in specs)
+
+
+def compile_layout(layout: dict) -> dict[str, tuple]:
+    """
+    Returns {page_name: draw_plan} for every page in the layout.
+    """
+    defaults = {"font": layout.get("font", "Helvetica"), "size": layout.get("size", 10)}
+
+    return {
+        name: compile_plan(specs, defaults)
+        for name, specs in layout.items()
+        if isinstance(specs, list)
+    }
+
+
+def run_plan(c, plan: tuple, fields, dy: float = 0):
+    for step in plan:
+        step(c, fields, dy)
@@ -1,22 +1,26 @@
 import configparser
 from datetime import date, datetime
+import hashlib
 import io
-# import json
+import json
 # import os
-import textwrap
-from typing import Any, Optional
+from typing import Any, Iterable, Iterator, Optional
+from reportlab import rl_config
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
 from pypdf import PdfReader, PdfWriter, Transformation
+from pypdf.generic import ArrayObject, BooleanObject, DictionaryObject, NameObject
 from backend.models import Form2Data, FormsPayload, Payload, Form11Data, StoredDocumentUploads
 import base64
-from reportlab.lib.utils import ImageReader
-from reportlab.lib import colors 
-from PIL import Image
 import sys
 from pathlib import Path
 
+from backend.atomic import atomic_write
 from backend.pdf_utils.send_mail import ensure_config, get_app_dir
+from backend.pdf_utils.layout import run_plan
+from backend.pdf_utils.images import image_reader, target_pixels
+from backend.pdf_utils.signature import Signature, prepare_signature
+from backend.pdf_utils.templates import Template, templates
 
 
 def resource_path(relative_path: str) -> str:
@@ -31,8 +35,10 @@ def resource_path(relative_path: str) -> str:
     return str((base / relative_path).resolve())
 
 
-TEMPLATE_PATH = resource_path("template.pdf")
-OVERLAY_PATH = resource_path("overlay.pdf")
+# Image streams are written as raw binary instead of ASCII85 text. ReportLab's
+# ASCII85 encoder is pure Python and was most of the render time for scans,
+# and it makes every embedded image 25% larger.
+rl_config.useA85 = 0
 
 APP_DIR = get_app_dir()
 CONFIG_PATH = APP_DIR / "config.ini"
@@ -50,8 +56,33 @@ CONFIG_PATH = APP_DIR / "config.ini"
 
 
 
+TSV_HEADERS = [
+    "Member Name",
+    "Date of Birth",
+    "Mobile Number",
+
+    "UAN",
+    "Bank acc. no.",
+    "Bank IFSC",
+
+    "Father / Husband Name",
+    "PF Account Number",
+
+    "Nominee 1 Name",
+    "Nominee 1 DOB",
+    "Nominee 1 Relationship",
+
+    "Nominee 2 Name",
+    "Nominee 2 DOB",
+    "Nominee 2 Relationship",
+]
+
+
 def form2_to_tsv(forms) -> str:
-    
+    """
+    One ledger row, in the order of TSV_HEADERS.
+    """
+
     def clean(value):
         if value is None:
             return ""
@@ -60,27 +91,6 @@ def form2_to_tsv(forms) -> str:
     f2 = forms.form_2
     f11 = forms.form_11
 
-    headers = [
-        "Member Name",
-        "Date of Birth",
-        "Mobile Number",
-
-        "UAN",
-        "Bank acc. no.",
-        "Bank IFSC",
-        
-        "Father / Husband Name",
-        "PF Account Number",
-
-        "Nominee 1 Name",
-        "Nominee 1 DOB",
-        "Nominee 1 Relationship",
-
-        "Nominee 2 Name",
-        "Nominee 2 DOB",
-        "Nominee 2 Relationship",
-    ]
-
     values = [
         f2.member_name,
         f2.date_of_birth,
@@ -106,531 +116,52 @@ def form2_to_tsv(forms) -> str:
         else:
             values.extend(["", "", ""])
 
-    header_row = "\t".join(headers)
-    data_row = "\t".join(clean(v) for v in values)
-
-    
-    
-
-
-    return data_row
-    return "\t".join(str(v) for v in values)
-
-    # return f"{header_row}\n{data_row}" # to include header
+    return "\t".join(clean(v) for v in values)
 
 
 #                                                                                --- FORM 11 FUNCTION ---
 
-def form_11(c, data, extra: Optional[dict[str,Any]]):
+def form_11(c, data, extra: Optional[dict[str,Any]], signature: Signature | None = None, plans: dict | None = None):
 
     if extra is None:
         extra = {}
-    
-    fields = prepare_form11_pdf_fields(data)
-    
-
-
-
-    EPFS_POSITIONS = {
-        True: (424, 602),
-        False: (502, 602),
-    }
-    EPS_POSITIONS = {
-        True: (424, 589),
-        False: (502, 589),
-    }
-
-    INTERNATIONAL_WORKER_POS = {
-        True: (424, 496),
-        False: (502, 496),
-    }
-
-    company_x = 450 - len(defaultValuesFromConfig.get("company_name","")) * 1.5
-
-    FIELD_MAP = {
-        "company": (company_x,753, defaultValuesFromConfig.get("company_name","")),
-        "name": (350, 705, fields["name"].upper()),
-        "name_declaration": (183, 265, fields["name"].upper(), True),
-        "father_name": (350, 682, fields["father_name"].upper()),
-        "dob_day": (350, 665, fields["dob_day"]),
-        "dob_month": (430, 665, fields["dob_month"]),
-        "dob_year": (495, 665, fields["dob_year"]),
-        "gender": (350, 650, fields["gender"].upper()),
-        "marital_status": (350, 635, fields["marital_status"].upper()),
-        "mail": (350, 624, fields["email"]),
-        "mobile": (350, 612, fields["mobile"]),
-        "member_of_epf": (
-            *EPFS_POSITIONS[fields["member_of_epf"]],
-            "✔",
-        ),
-        "member_of_eps": (
-            *EPS_POSITIONS[fields["member_of_eps"]],
-            "✔",
-        ),
-
-
-        # "prev_pf_no": (350, 546, fields["pf_no"]),
-        "exit_date_day": (350, 534, fields["exit_date_day"]),
-        "exit_date_month": (455, 534, fields["exit_date_month"]),
-        "exit_date_year": (530, 534, fields["exit_date_year"]),
-        "scheme_cert_no": (350, 521, fields["scheme_cert_no"]),
-        "ppo": (350, 508, fields["ppo"]),
-
-        "international_worker": (
-            *INTERNATIONAL_WORKER_POS[fields["international_worker"]], "✔"
-        ),
-        "country_of_origin": (350, 484, fields["country_of_origin"]),
-        "passport_no": (350, 472, fields["passport_no"]),
-        "pp_validity": (350, 460, fields["pp_validity"]),
-
-
-
-        "bank_and_ifsc": (350, 434, fields["bank_and_ifsc"]),
-        "aadhaar": (350, 420, fields["aadhaar"]),
-        "pan": (350, 405, fields["pan"]),
-        "date": (100, 305, fields["date"]),
-        "place" : (100, 294, fields["place"])
-
-    }
-
-    BASE_FONT = 10
-    BASE_CHARS = 28
-    MIN_FONT = 6
-
-    for _, value in FIELD_MAP.items():
-        x, y, text = value[:3]
-        spaceConstraint = value[3] if len(value) > 3 else False
-        
-        if text:  # safety
-            if spaceConstraint and len(text) >= 28:
-                font_size = max(
-                MIN_FONT,
-                BASE_FONT * BASE_CHARS / max(len(text), BASE_CHARS)
-)
-                c.setFontSize(font_size)
-            else:
-                c.setFontSize(10)
-                
-            c.drawString(x, y, str(text))
-
-
-    c.acroForm.textfield(
-    name="pf_number",
-    tooltip="Enter PF Number",
-    x=150,
-    y=250,
-    fontSize=10,
-    height=12,
-    maxlen=14, 
-    borderWidth=0,       
-    forceBorder=False,     
-    fillColor=colors.transparent,       
-    borderColor=colors.transparent,
-    value="",
-    textColor=colors.black,
-    )
-
-
-    c.acroForm.textfield(
-    name="employee_number",
-    tooltip="Enter employee code",
-    x=425,
-    y=773,
-    fontSize=13,
-    height=14,
-    maxlen=8, 
-    width = 60,
-    borderWidth=0,       
-    forceBorder=False,     
-    fillColor=colors.transparent,       
-    borderColor=colors.transparent,
-    value=extra["eno"] if extra["eno"] else "",
-    textColor=colors.black,
-    )
-
-    c.acroForm.textfield(
-    name="pf_number_top",
-    tooltip="Enter PF Number",
-    x=205,
-    y=794,
-    fontSize=14,
-    width = 45,
-    height=16,
-    maxlen=5, 
-    borderWidth=0,       
-    forceBorder=False,     
-    fillColor=colors.transparent,       
-    borderColor=colors.transparent,
-    value="",
-    textColor=colors.black,
-    )
-    
-    c.acroForm.textfield(
-        name="uan_f1",
-        tooltip="Enter UAN",
-        x=350,
-        maxlen=12, 
-        y=558,
-        width=140,
-        height=14,
-        fontSize=10,
-        borderWidth=0,    
-        textColor=colors.black,     
-        forceBorder=False,     
-        fillColor=colors.transparent,       
-        borderColor=colors.transparent,
-        value=fields["uan"] if fields["uan"] else "",
-    )
-    
-    c.acroForm.textfield(
-        name="pf_ac_number_f1",
-        tooltip="Enter PF account number",
-        x=350,
-        maxlen=26, 
-        y=542,
-        width=140,
-        height=14,
-        fontSize=10,
-        borderWidth=0,    
-        textColor=colors.black,     
-        forceBorder=False,     
-        fillColor=colors.transparent,       
-        borderColor=colors.transparent,
-        value=fields["pf_no"] if fields["pf_no"] else "",
-    )
-    
-
-
-    c.acroForm.textfield(
-    name="join_date",
-    tooltip="Enter joining date",
-    x=445,
-    maxlen=10, 
-    y=262,
-    width=55,
-    height=12,
-    fontSize=10,
-    borderWidth=0,       
-    forceBorder=False,     
-    fillColor=colors.transparent,       
-    borderColor=colors.transparent,
-    value=str(date.today().strftime("%d/%m/%Y")),
-    textColor=colors.black,
-    )
-
+    if plans is None:
+        plans = templates.current().plans
 
-    sig_data = data.declaration.signature_data
-    bounds = sig_data.bbox
-    signature_img = signature_to_image(sig_data.image)
+    fields = prepare_form11_pdf_fields(data)
 
-    # (bounds.y - bounds.height)*0.2667
-    if signature_img:
-        c.drawImage(
-            signature_img,
-            x=500 - (bounds.x - bounds.width/2)*0.2667,
-            y=290 + (bounds.y - bounds.height/2)*0.2667,
-            width=106,
-            height=40,
-            mask="auto"
-        )
-    
-    
+    fields["company"] = defaultValuesFromConfig.get("company_name","")
+    fields["eno"] = extra.get("eno") or ""
+    fields["join_date"] = date.today().strftime("%d/%m/%Y")
+    fields["signature"] = signature
 
-def wrap_address(addr: str, width: int = 48, max_lines: int = 3) -> list[str]:
-    lines = textwrap.wrap(addr, width=width)
-    return lines[:max_lines]
+    run_plan(c, plans["form_11"], fields)
 
 
 #                                                                                --- FORM 2 FUNCTION ---
 
-def form_2(c,data, sigData = None):
+def form_2(c,data, sigData = None, plans: dict | None = None):
     data = prepare_form2_pdf_fields(data)
+    if plans is None:
+        plans = templates.current().plans
     
-    f2_page1(c, data, sigData)
+    f2_page1(c, data, sigData, plans)
     c.showPage()
-    f2_page2(c, data, sigData)
-    
-
-
-
-def f2_page1(c,fields, sigData = None):
-    
-    # print(fields)
-    
-    def normalize_address(addr: str) -> str:
-        return " ".join(addr.replace("\n", " ").split())
-
-    
-
-    
-    def draw_address(c, addr: str, x: int, y: int):
-        addr = normalize_address(addr)
-        lines = wrap_address(addr)
-
-        line_height = 20
-        c.setFontSize(9)
-
-        for i, line in enumerate(lines):
-            c.drawString(x, y - (i * line_height), line)
-        
-        c.setFontSize(10)
-
-            
+    f2_page2(c, data, sigData, plans)
     
-    draw_address(c, fields["address"], x=273, y=577)
-    
-
-    NOMINEE_BLOCK_HEIGHT = 80      # total height per nominee
-    LINE_HEIGHT = 10
-    ADDRESS_START_OFFSET = -16
-    
-            
-        
-    def draw_epf_nominee_block(c, nominee, x, y):
-        # Column X positions
-        NAME_X = x
-        REL_X = 220
-        DOB_X = 285
-        SHARE_X = 370
-        MINOR_X = 430
-
-        is_minor = nominee.is_minor
-
-        c.setFont("Helvetica", 10)
-        c.drawString(NAME_X, y, nominee.name)
-
-        relationship = nominee.other_relationship if nominee.relationship.lower() == "other" else nominee.relationship
-        c.drawString(REL_X, y, relationship)
-
-        c.drawString(DOB_X, y, nominee.date_of_birth)
-        c.drawString(SHARE_X, y, f"{int(nominee.share_percentage)}%")
-
-        if is_minor:
-            c.drawString(MINOR_X, y, nominee.guardian_name)
-            c.drawString(MINOR_X, y - LINE_HEIGHT - 2, nominee.guardian_relationship)
-
-
-        # ---- Address (below name, multi-line) ----
-        addr_lines = wrap_address(nominee.address, 34)
-        guardian_addr = (
-            wrap_address(nominee.guardian_address, 32)
-            if is_minor
-            else None
-        )
 
 
-        if addr_lines:
-            c.setFont("Helvetica", 8)
-            for i, line in enumerate(addr_lines):
-                c.drawString(
-                    NAME_X,
-                    y + ADDRESS_START_OFFSET - (i * LINE_HEIGHT),
-                    line,
-                )
-            c.setFont("Helvetica", 10)
 
-        if guardian_addr:
-            c.setFont("Helvetica", 8)
-            for i, line in enumerate(guardian_addr):
-                c.drawString(
-                    MINOR_X,
-                    y + ADDRESS_START_OFFSET - 6 - (i * LINE_HEIGHT),
-                    line,
-                )
-            c.setFont("Helvetica", 10)
+def f2_page1(c,fields, sigData = None, plans: dict | None = None):
+    plans = plans or templates.current().plans
+    run_plan(c, plans["form_2_page_1"], {**fields, "signature": sigData})
 
 
+def f2_page2(c,fields, sigData = None, plans: dict | None = None):
+    plans = plans or templates.current().plans
+    run_plan(c, plans["form_2_page_2"], {**fields, "signature": sigData})
 
-    def draw_epf_nominees(c, nominees, x, start_y):
-        for idx, nominee in enumerate(nominees[:2]):
-            block_y = start_y - (idx * NOMINEE_BLOCK_HEIGHT)
-            draw_epf_nominee_block(c, nominee, x, block_y)
 
-
-    draw_epf_nominees(c, fields["nominees_epf"], x=55, start_y=335)
-    
-
-    FIELD_MAP = {
-        "name": (260, 672, fields["name"].upper(), True),
-        "father_name": (250, 652, fields["father_husband_name"].upper()),
-        "dob": (200, 633, fields["dob"]),
-        "gender": (380, 633, fields["gender"].upper()),
-        "marital_status": (200, 595, fields["marital_status"].upper()),
-        "mobile": (400, 595, fields["mobile"]),
-    }
-
-    BASE_FONT = 10
-    BASE_CHARS = 28
-    MIN_FONT = 6
-
-    for _, value in FIELD_MAP.items():
-        x, y, text = value[:3]
-        spaceConstraint = value[3] if len(value) > 3 else False
-        
-        if text:  # safety
-            if spaceConstraint and len(text) >= 28:
-                font_size = max(
-                MIN_FONT,
-                BASE_FONT * BASE_CHARS / max(len(text), BASE_CHARS)
-                )   
-                c.setFontSize(font_size)
-            else:
-                c.setFontSize(10)
-                
-            c.drawString(x, y, str(text))
-            
-    
-    c.acroForm.textfield(
-        name="pf_ac_number_f2",
-        tooltip="Enter PF account number",
-        x=407,
-        maxlen=26, 
-        y=610,
-        width=140,
-        height=14,
-        fontSize=10,
-        borderWidth=0,    
-        textColor=colors.black,     
-        forceBorder=False,     
-        fillColor=colors.transparent,       
-        borderColor=colors.transparent,
-        value=fields["ppn"] if fields["ppn"] else "",
-    )
-    
-    
-    c.acroForm.textfield(
-        name="emp_no",
-        tooltip="Enter employee number",
-        x=175,
-        maxlen=8,
-        y=610,
-        width=60,
-        height=14,
-        fontSize=10,
-        borderWidth=0,    
-        textColor=colors.black,     
-        forceBorder=False,     
-        fillColor=colors.transparent,       
-        borderColor=colors.transparent,
-        value=fields["eno"],
-    )
-            
-            
-    sig_data = sigData
-    bounds = sig_data.bbox
-    signature_img = signature_to_image(sig_data.image)
-
-    # (bounds.y - bounds.height)*0.2667
-    if signature_img:
-        c.drawImage(
-            signature_img,
-            x=420 - (bounds.x - bounds.width/2)*0.2667,       
-            y=80 + (bounds.y - bounds.height/2)*0.2667,        
-            width=106,    
-            height=40,
-            mask="auto"  
-        )
-
-
-def f2_page2(c,fields, sigData = None):
-    
-    
-    NOMINEE_BLOCK_HEIGHT = 50     # total height per member
-    LINE_HEIGHT = 10
-    ADDRESS_START_OFFSET = -12
-    
-    def draw_eps_member_block(c, member, x, y):
-        # Column X positions
-        NAME_X = x
-        ADDR_X = 240
-        DOB_X = 385
-        REL_X = 485
-
-        # ---- Name (main row) ----
-        c.setFont("Helvetica", 10)
-        c.drawString(NAME_X, y, member.name)
-        
-        # ---- Other columns (aligned with name) ----
-        
-        addr_lines = wrap_address(member.address, 34)
-
-        if addr_lines:
-            c.setFont("Helvetica", 8)
-            for i, line in enumerate(addr_lines):
-                c.drawString(
-                    ADDR_X,
-                    y  - (i * LINE_HEIGHT),
-                    line,
-                )
-            c.setFont("Helvetica", 10)
-        
-        c.drawString(DOB_X, y, member.date_of_birth)
-        c.drawString(REL_X, y, member.relationship)        
-
-        
-
-
-
-    def draw_eps_members(c, members, x, start_y):
-        for idx, member in enumerate(members[:2]):
-            block_y = start_y - (idx * NOMINEE_BLOCK_HEIGHT)
-            draw_eps_member_block(c, member, x, block_y)
-
-
-    draw_eps_members(c, fields["nominees_eps"], x=90, start_y=668) if fields["nominees_eps"] else None
-    
-    
-    def draw_eps_nominee_block(c, member, x, y):
-        # Column X positions
-        NAME_X = x
-        DOB_X = 310
-        REL_X = 450
-
-        # ---- Name (main row) ----
-        c.setFont("Helvetica", 10)
-        c.drawString(NAME_X, y, member.name)
-        addr_lines = wrap_address(member.address, 34)
-
-        if addr_lines:
-            c.setFont("Helvetica", 8)
-            for i, line in enumerate(addr_lines):
-                c.drawString(
-                    NAME_X,
-                    y + ADDRESS_START_OFFSET - (i * LINE_HEIGHT),
-                    line,
-                )
-            c.setFont("Helvetica", 10)
-        
-        # ---- Other columns (aligned with name) ----
-        
-        c.drawString(DOB_X, y, member.date_of_birth)
-        c.drawString(REL_X, y, member.relationship)
-        
-        
-        
-    # print(fields["pension_nominee"])
-    draw_eps_nominee_block(c, fields["pension_nominee"], 55,467) if fields["pension_nominee"] else None
-
-    
-    sig_data = sigData
-    bounds = sig_data.bbox
-    signature_img = signature_to_image(sig_data.image)
-
-    # (bounds.y - bounds.height)*0.2667
-    if signature_img:
-        c.drawImage(
-            signature_img,
-            x=425 - (bounds.x - bounds.width/2)*0.2667,       
-            y=350 + (bounds.y - bounds.height/2)*0.2667,        
-            width=106,    
-            height=40,
-            mask="auto"  
-        )
-        
-    c.drawString(80, 364, str(fields["date"]))
-    c.drawString(80, 350, fields["place"])
-    
-    pass
 TEMPLATE = resource_path("config.template.ini")  # bundled, read-only
 
 
@@ -658,126 +189,192 @@ def readDefaults():
 
 defaultValuesFromConfig = readDefaults()
 
-def generate_merged_forms(output_path: str, data: FormsPayload, docs: StoredDocumentUploads):
-    
+def form_signature(data: FormsPayload):
+    sig = data.form_2.declaration.signature_data
 
-    c = canvas.Canvas(OVERLAY_PATH, pagesize=A4)
-    c.setFont("Helvetica", 10)
-    
-    c.setTitle("PF")
+    # the frontend sends image "same" whenever both signatures match, with or without same_signature
+    if data.form_2.declaration.same_signature or (sig and sig.image == "same"):
+        return data.form_11.declaration.signature_data
+    return sig
 
-    form_11(c, data.form_11, extra={"eno":data.form_2.employee_no})
-    
-    c.showPage()
-    form_2(c, data.form_2, sigData=data.form_2.declaration.signature_data if not data.form_2.declaration.same_signature else data.form_11.declaration.signature_data)
 
-    c.save()
+def prepare_signatures(data: FormsPayload) -> tuple[Signature | None, Signature | None]:
+    """
+    (form 11 signature, form 2 signature), each trimmed and decoded once.
+    Form 2 reuses the Form 11 image when it is the same signature.
+    """
+    f11_data = data.form_11.declaration.signature_data
+    f2_data = form_signature(data)
 
-    # forms_pdf = PdfReader(OVERLAY_PATH)
-    c.acroForm.needAppearances = True
+    f11 = prepare_signature(f11_data.image) if f11_data else None
+    if f2_data is f11_data or (f2_data and f11_data and f2_data.image == f11_data.image):
+        return f11, f11
+    return f11, prepare_signature(f2_data.image) if f2_data else None
 
-    writer = PdfWriter()
 
-    template_pdf = PdfReader(TEMPLATE_PATH)
-    overlay_pdf = PdfReader(OVERLAY_PATH)
+def render_forms(data: FormsPayload, docs: StoredDocumentUploads, template: Template | None = None) -> bytes:
+    """
+    Renders the merged Form 11 / Form 2 PDF (plus attachments) fully in memory,
+    on the active template unless another version is given.
+    """
+    if template is None:
+        template = templates.current()
+    reader = template.reader()
 
-    template_pages = len(template_pdf.pages)
+    overlay_buf = io.BytesIO()
+    c = canvas.Canvas(overlay_buf, pagesize=A4)
+    c.setFont("Helvetica", 10)
+    
+    c.setTitle("PF")
 
-    for i, overlay_page in enumerate(overlay_pdf.pages):
-        if i < template_pages:
-            base = template_pdf.pages[i]
-            base.merge_page(overlay_page)
-            writer.add_page(base)
-        else:
-            # pages beyond template (attachments)
-            writer.add_page(overlay_page)
+    f11_signature, sig_data = prepare_signatures(data)
 
-    sig_data=data.form_2.declaration.signature_data if not data.form_2.declaration.same_signature else data.form_11.declaration.signature_data
+    form_11(c, data.form_11, extra={"eno":data.form_2.employee_no}, signature=f11_signature, plans=template.plans)
+    
+    c.showPage()
+    form_2(c, data.form_2, sigData=sig_data, plans=template.plans)
 
+    # Image attachments are drawn on the same canvas, so the signature image is
+    # embedded once for the whole document. PDF attachments are merged below.
+    attachments = []   # overlay page index, or raw PDF bytes
 
     for _, stored_doc in docs:
 
         # ---- PDF attachment ----
         if stored_doc.type == "application/pdf":
-            append_pdf_attachment(
-                writer,
-                decode_base64(stored_doc.base64),
-                sig_data
-            )
+            attachments.append(decode_base64(stored_doc.base64))
             continue
 
         # ---- IMAGE attachment ----
-        c = canvas.Canvas(OVERLAY_PATH, pagesize=A4)
         draw_attachment_page(c, stored_doc, sig_data)
         draw_signature(c, sig_data, x=A4[0]/2, y=20)
+        attachments.append(c.getPageNumber() - 1)
 
-        c.save()
-
-        img_pdf = PdfReader(OVERLAY_PATH)
-        writer.add_page(img_pdf.pages[-1])
+    c.save()
 
+    writer = PdfWriter()
 
+    overlay_pdf = PdfReader(overlay_buf)
 
+    for i, template_page in enumerate(reader.pages):
+        # add_page clones the template page, the shared reader stays untouched
+        base = writer.add_page(template_page)
+        base.merge_page(overlay_pdf.pages[i])
 
-    with open(output_path, "wb") as f:
-        writer.write(f)
+    register_form_fields(writer, overlay_pdf, len(reader.pages))
 
+    for attachment in attachments:
+        if isinstance(attachment, int):
+            writer.add_page(overlay_pdf.pages[attachment])
+        else:
+            append_pdf_attachment(writer, attachment, sig_data)
 
-    # print("✅ PDF Generated: ", output_path)
+    buf = io.BytesIO()
+    writer.write(buf)
+    return buf.getvalue()
 
 
-def draw_signature(c, sig_data, x, y, width=106, height=40):
-    if not sig_data:
+def register_form_fields(writer: PdfWriter, overlay_pdf: PdfReader, form_pages: int):
+    """
+    merge_page copies the editable fields onto the form pages, but not the
+    /AcroForm dictionary listing them - without it most viewers do not let
+    HR fill them in (or save what was filled in).
+    """
+    source = overlay_pdf.trailer["/Root"].get("/AcroForm")
+    if source is None:
         return
 
-    signature_img = signature_to_image(sig_data.image)
-    if not signature_img:
-        return
+    fields = ArrayObject()
+    for page in writer.pages[:form_pages]:
+        for annot in page.get("/Annots") or []:
+            if annot.get_object().get("/Subtype") == "/Widget":
+                fields.append(annot)
 
-    bounds = sig_data.bbox
+    acroform = DictionaryObject({
+        NameObject("/Fields"): fields,
+        NameObject("/NeedAppearances"): BooleanObject(True),
+    })
+    for key in ("/DA", "/DR"):
+        if key in source:
+            acroform[NameObject(key)] = source[key].clone(writer)
 
-    c.drawImage(
-        signature_img,
-        x=x - (bounds.x - bounds.width / 2) * 0.2667 * 2, # * 2 since width will move it towards right
-        y=y + (bounds.y - bounds.height / 2) * 0.2667,
-        width=width*2,
-        height=height*2,
-        mask="auto",
-    )
+    writer._root_object[NameObject("/AcroForm")] = writer._add_object(acroform)
 
 
+# Bump whenever a change to the drawing code changes the output for the same input
+RENDER_VERSION = 1
 
-def crop_signature(signature_data):
+
+def render_key(data: FormsPayload, docs: StoredDocumentUploads, template: Template) -> str:
     """
-    signature_data: SignatureData (image + bbox)
-    returns: ImageReader of cropped signature
+    Content hash of a render: two submissions with the same key produce the same PDF.
+
+    Built from the template version (PDF and layout), the drawing code version,
+    the config defaults printed on the forms, the prepared PDF fields (which
+    include today's date), the signatures and the documents, so any change to
+    what is drawn gives a new key.
     """
+    f11_sig, f2_sig = data.form_11.declaration.signature_data, form_signature(data)
+
+    h = hashlib.sha256()
+    h.update(f"{template.hash}|{RENDER_VERSION}|{defaultValuesFromConfig.get('company_name', '')}".encode("utf-8"))
+    h.update(json.dumps({
+        "form_11": prepare_form11_pdf_fields(data.form_11),
+        "form_2": prepare_form2_pdf_fields(data.form_2),
+        "eno": data.form_2.employee_no,
+        "join_date": date.today().isoformat(),
+    }, sort_keys=True, default=str).encode("utf-8"))
 
-    # 1. Decode base64 image
-    header, encoded = signature_data.image.split(",", 1)
-    image_bytes = base64.b64decode(encoded)
+    for sig in (f11_sig, f2_sig):
+        h.update(b"\0" + (sig.image if sig else "").encode("ascii", "replace"))
 
-    img = Image.open(io.BytesIO(image_bytes)).convert("RGBA")
+    for key, doc in docs:
+        h.update(f"\0{key}|{doc.type}|".encode("utf-8"))
+        h.update(hashlib.sha256(doc.base64.encode("ascii", "replace")).digest())
 
-    # 2. Extract bbox
-    x = int(signature_data.bbox.x)
-    y = int(signature_data.bbox.y)
-    w = int(signature_data.bbox.width)
-    h = int(signature_data.bbox.height)
+    return h.hexdigest()
 
-    # Safety clamp
-    w = max(1, w)
-    h = max(1, h)
 
-    # 3. Crop (Pillow uses top-left origin)
-    cropped = img.crop((x, y, x + w, y + h))
+def first_page_pdf(pdf_bytes: bytes) -> bytes:
+    """
+    Page 1 (Form 11) of a merged PDF, as a PDF of its own, editable fields included.
+    """
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    writer = PdfWriter()
+    writer.add_page(reader.pages[0])
+    register_form_fields(writer, reader, 1)
 
-    # 4. Convert to ReportLab ImageReader
     buf = io.BytesIO()
-    cropped.save(buf, format="PNG")
-    buf.seek(0)
+    writer.write(buf)
+    return buf.getvalue()
+
 
-    return ImageReader(buf)
+def generate_merged_forms(output_path: str, data: FormsPayload, docs: StoredDocumentUploads):
+    pdf_bytes = render_forms(data, docs)
+    atomic_write(output_path, pdf_bytes)
+    return pdf_bytes
+
+
+def render_batch(payloads: Iterable[Payload]) -> Iterator[bytes]:
+    """
+    Renders many submissions with one parsed template, yielding each finished PDF.
+    Layout plans and string widths are already shared module-wide, so the
+    per-document cost is just the drawing and merging.
+    """
+    template = templates.current()
+
+    for payload in payloads:
+        yield render_forms(payload.forms, payload.documents, template)
+
+
+def draw_signature(c, signature: Signature | None, x, y, width=212, height=80):
+    """
+    Self-attestation signature, centred horizontally on x.
+    """
+    if not signature:
+        return
+
+    signature.draw(c, x - width / 2, y, width, height)
 
 
 def prepare_form11_pdf_fields(data: Form11Data) -> dict:
@@ -868,6 +465,26 @@ def prepare_form2_pdf_fields(data: Form2Data) -> dict:
         )
     eps_members = d.eps_family_members if (d.marital_status=="married" or d.marital_status=="widow") else []
 
+    def epf_nominee_fields(n):
+        return {
+            "name": n.name,
+            "relationship": n.other_relationship if n.relationship.lower() == "other" else n.relationship,
+            "dob": n.date_of_birth,
+            "share": f"{int(n.share_percentage)}%",
+            "address": n.address,
+            "guardian_name": n.guardian_name if n.is_minor else "",
+            "guardian_relationship": n.guardian_relationship if n.is_minor else "",
+            "guardian_address": n.guardian_address if n.is_minor else "",
+        }
+
+    def family_member_fields(m):
+        return {
+            "name": m.name,
+            "address": m.address,
+            "dob": m.date_of_birth,
+            "relationship": m.relationship,
+        }
+
 
     return {
         "name": d.member_name,
@@ -885,12 +502,12 @@ def prepare_form2_pdf_fields(data: Form2Data) -> dict:
         "eno":d.employee_no if d.employee_no else "",
 
         "has_no_family_epf": d.has_no_family_epf,
-        "nominees_epf": epf_nominees,
+        "nominees_epf": [epf_nominee_fields(n) for n in epf_nominees],
 
         "has_no_family_eps": d.has_no_family_eps,
-        "nominees_eps": eps_members,
+        "nominees_eps": [family_member_fields(m) for m in eps_members],
 
-        "pension_nominee": d.pension_nominee,
+        "pension_nominee": [family_member_fields(d.pension_nominee)] if d.pension_nominee else [],
 
         "place": decl.place,
         "date": datetime.now().strftime("%d/%m/%Y"),
@@ -901,22 +518,6 @@ def prepare_form2_pdf_fields(data: Form2Data) -> dict:
 
 
 
-def signature_to_image(signature_data: str) -> ImageReader:
-    """
-    Converts base64 signature data URL to a ReportLab ImageReader
-    """
-    if not signature_data:
-        return None
-
-    # Remove data:image/...;base64, part
-    header, encoded = signature_data.split(",", 1)
-
-    image_bytes = base64.b64decode(encoded)
-    image_stream = io.BytesIO(image_bytes)
-
-    return ImageReader(image_stream)
-
-
 def decode_base64(data_url: str) -> bytes:
     return base64.b64decode(data_url.split(",", 1)[1])
 
@@ -939,15 +540,15 @@ def draw_attachment_page(c, doc, sig_data = None, scale=0.7):
     if doc.type in ("image/png", "image/jpeg"):
         c.showPage()
 
-        img = Image.open(io.BytesIO(raw))
-        img_w, img_h = img.size
-
         a4_w, a4_h = A4
 
         # Target box = 70% of A4
         target_w = a4_w * scale
         target_h = a4_h * scale
 
+        # decoded straight at the resolution it is printed at
+        img, (img_w, img_h) = image_reader(raw, target_pixels(target_w, target_h))
+
         # Compute scale to fit image into target box
         ratio = min(target_w / img_w, target_h / img_h)
 
@@ -960,7 +561,7 @@ def draw_attachment_page(c, doc, sig_data = None, scale=0.7):
         
         
         c.drawImage(
-            ImageReader(img),
+            img,
             x,
             y,
             width=draw_w,
@@ -986,10 +587,8 @@ def create_self_attest_overlay(sig_data, page_size=A4):
     draw_signature(
         c,
         sig_data,
-        x=page_size[0] / 2 - 50,   # centered bottom
-        y=20,                      # bottom margin
-        width=100,
-        height=40,
+        x=page_size[0] / 2,   # centered bottom
+        y=20,                 # bottom margin
     )
 
     c.save()
@@ -1033,7 +632,6 @@ def append_pdf_attachment(
 
     overlay = create_self_attest_overlay(sig_data)
 
-    blank.merge_transformed_page(page, transform)
     blank.merge_page(overlay)
 
 
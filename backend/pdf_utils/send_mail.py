@@ -1,10 +1,14 @@
 import configparser
 from datetime import datetime
+import html
+import io
+import json
 import shutil
 import smtplib
 from email.message import EmailMessage
 from pathlib import Path
 import sys
+import zipfile
 
 # import os
 # from dotenv import load_dotenv
@@ -86,47 +90,44 @@ def read_config():
 
 
 
-def send_mail(
-    name: str | None = None,
-    UAN: str | None = None,
-    attachment_path: str | None = None,
-):
-    
+# seconds an SMTP connection may hang before the attempt counts as failed
+SMTP_TIMEOUT = 30
+
 
+def mail_settings() -> dict | None:
+    """
+    Mail config if mailing is set up and enabled, otherwise None (and the reason is printed).
+    """
     try:
         ensure_config()
-        read_config()
+        cfg = read_config()
     except RuntimeError as e:
         print(e)
-        return False
-
-    cfg = read_config()
-    
-    SEND_MAIL = cfg["send_mail"]
-
-    SMTP_HOST = cfg["smtp_host"]
-    SMTP_PORT = cfg["smtp_port"]
-    EMAIL_USER = cfg["email"]
-    EMAIL_PASS = cfg["password"]
-    EMAIL_TO = cfg["to_mail"]
-    MAIL_SUB = cfg["subject"]
-    MAIL_BODY = cfg["body"]
+        return None
 
-
-    if not EMAIL_USER or not EMAIL_PASS:
+    if not cfg["email"] or not cfg["password"]:
         print("Email credentials not set")
-        return False
+        return None
     
-    if not SEND_MAIL:
+    if not cfg["send_mail"]:
         print("Mailing has been disabled. To enable, edit mail.ini and set send_mail = True")
-        return False
+        return None
+
+    return cfg
 
+
+def build_message(
+    cfg: dict,
+    name: str | None = None,
+    UAN: str | None = None,
+    attachment_path: str | None = None,
+) -> EmailMessage:
     msg = EmailMessage()
-    msg["From"] = EMAIL_USER
-    msg["To"] = EMAIL_TO
-    msg["Subject"] = MAIL_SUB
+    msg["From"] = cfg["email"]
+    msg["To"] = cfg["to_mail"]
+    msg["Subject"] = cfg["subject"]
     
-    MAIL_BODY_WITH_NAME = f"{MAIL_BODY} \n\n {name} \n {UAN}"
+    MAIL_BODY_WITH_NAME = f"{cfg['body']} \n\n {name} \n {UAN}"
 
     msg.set_content(MAIL_BODY_WITH_NAME)
 
@@ -140,11 +141,99 @@ def send_mail(
                 filename=path.name,
             )
 
-    with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
+    return msg
+
+
+def digest_row(mail: dict) -> dict:
+    """
+    The Excel summary row of a queued mail's submission, or just its name and UAN
+    if the JSON (output/<name>.json, next to the PDF/ folder) cannot be read.
+    """
+    from backend.json_to_excel import extract_row
+
+    pdf = Path(mail["attachment_path"] or "")
+    try:
+        with open(pdf.parent.parent / f"{pdf.stem}.json", "r", encoding="utf-8") as f:
+            return extract_row(json.load(f))
+    except (OSError, ValueError, KeyError, AttributeError):
+        return {"Member Name": (mail.get("name") or "").upper(), "UAN": mail.get("uan") or ""}
+
+
+def build_digest(cfg: dict, mails: list[dict], as_zip: bool = False) -> EmailMessage:
+    """
+    One mail for many submissions: a summary table and all their PDFs,
+    attached one by one or (as_zip) in a single zip.
+    """
+    from backend.json_to_excel import COLUMN_ORDER
+
+    rows = [digest_row(mail) for mail in mails]
+
+    msg = EmailMessage()
+    msg["From"] = cfg["email"]
+    msg["To"] = cfg["to_mail"]
+    msg["Subject"] = f"{cfg['subject']} ({len(mails)} submission{'s' if len(mails) != 1 else ''})"
+
+    tsv = "\n".join("\t".join(str(row.get(c, "")) for c in COLUMN_ORDER) for row in rows)
+    msg.set_content(f"{cfg['body']}\n\n" + "\t".join(COLUMN_ORDER) + "\n" + tsv)
+
+    header = "".join(f"<th>{html.escape(c)}</th>" for c in COLUMN_ORDER)
+    body = "".join(
+        "<tr>" + "".join(f"<td>{html.escape(str(row.get(c, '')))}</td>" for c in COLUMN_ORDER) + "</tr>"
+        for row in rows
+    )
+    msg.add_alternative(
+        f"<p>{html.escape(cfg['body']).replace(chr(10), '<br>')}</p>"
+        f"<table border=\"1\" cellpadding=\"4\" cellspacing=\"0\"><tr>{header}</tr>{body}</table>",
+        subtype="html",
+    )
+
+    paths = [Path(mail["attachment_path"]) for mail in mails if mail["attachment_path"]]
+    if as_zip:
+        # PDFs are compressed already: stored, not deflated
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as zf:
+            for path in paths:
+                zf.write(path, path.name)
+        msg.add_attachment(
+            buffer.getvalue(),
+            maintype="application",
+            subtype="zip",
+            filename=f"PF_{datetime.now():%d-%m-%Y_%H%M}.zip",
+        )
+    else:
+        for path in paths:
+            with open(path, "rb") as f:
+                msg.add_attachment(f.read(), maintype="application", subtype="pdf", filename=path.name)
+
+    return msg
+
+
+def deliver(cfg: dict, msg: EmailMessage):
+    """
+    Sends msg over SMTP. Raises on any failure.
+    """
+    with smtplib.SMTP(cfg["smtp_host"], cfg["smtp_port"], timeout=SMTP_TIMEOUT) as server:
         server.ehlo()
         server.starttls()
         server.ehlo()
-        server.login(EMAIL_USER, EMAIL_PASS)
+        server.login(cfg["email"], cfg["password"])
         server.send_message(msg)
 
-    print("Mailed PDF: ", path.name)
+
+def send_mail(
+    name: str | None = None,
+    UAN: str | None = None,
+    attachment_path: str | None = None,
+):
+    """
+    Sends one mail right away. Submissions go through the outbox (backend/outbox.py) instead.
+    """
+    cfg = mail_settings()
+    if cfg is None:
+        return False
+
+    deliver(cfg, build_message(cfg, name, UAN, attachment_path))
+
+    if attachment_path:
+        print("Mailed PDF: ", Path(attachment_path).name)
+    return True
@@ -0,0 +1,119 @@
+import base64
+import io
+
+import numpy as np
+from PIL import Image
+from reportlab.lib.utils import ImageReader
+
+from backend.pdf_utils.images import decode
+
+
+# Signature preprocessing, done once per submission.
+#
+# The frontend sends the whole 400x150 drawing canvas. The ink is located from
+# the alpha channel (or from darkness, for images without transparency),
+# trimmed to its bounding box and recoloured to one ink colour. The result is a
+# small PNG that is embedded once and centred in each signature box.
+#
+# A signature box stands for the whole drawing canvas, so ink keeps the size it
+# was drawn at (relative to the pad) unless it has to shrink to fit the box.
+
+
+INK_COLOUR = (0x1A, 0x36, 0x5D)   # pen colour of the signature pad
+INK_THRESHOLD = 16                # alpha (0-255) below which a pixel is not ink
+PADDING = 4                       # pixels kept around the ink
+MAX_HEIGHT = 150                  # larger (photographed) signatures are scaled down to this
+
+# signatures come from a 400x150 canvas; anything far beyond that is not a signature
+MAX_PIXELS = (1600, 600)
+
+
+class Signature:
+    def __init__(self, reader: ImageReader, ink_width: int, ink_height: int, canvas_width: int):
+        self.reader = reader
+        # size of the ink in pixels of the original drawing canvas
+        self.ink_width = ink_width
+        self.ink_height = ink_height
+        self.canvas_width = canvas_width
+
+    def fit(self, x: float, y: float, box_w: float, box_h: float) -> tuple[float, float, float, float]:
+        """
+        (x, y, w, h) of the signature inside the box, centred.
+        """
+        scale = box_w / self.canvas_width
+        scale = min(scale, box_w / self.ink_width, box_h / self.ink_height)
+
+        w, h = self.ink_width * scale, self.ink_height * scale
+        return x + (box_w - w) / 2, y + (box_h - h) / 2, w, h
+
+    def draw(self, c, x: float, y: float, box_w: float, box_h: float):
+        x, y, w, h = self.fit(x, y, box_w, box_h)
+        c.drawImage(self.reader, x, y, width=w, height=h, mask="auto")
+
+
+def ink_alpha(rgba: np.ndarray) -> np.ndarray:
+    """
+    Ink coverage (0-255) of every pixel.
+    """
+    alpha = rgba[..., 3]
+    if alpha.min() < 255:
+        return alpha
+
+    # no transparency (a photo or a flattened PNG): ink is whatever is darker than the paper
+    gray = rgba[..., :3].astype(np.float32) @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    paper = np.percentile(gray, 90)
+    coverage = (paper - gray) / max(paper, 1.0) * 255 * 2
+    return np.clip(coverage, 0, 255).astype(np.uint8)
+
+
+def trim(alpha: np.ndarray) -> np.ndarray | None:
+    """
+    alpha cropped to the ink bounding box (plus PADDING), or None if there is no ink.
+    """
+    ink = alpha > INK_THRESHOLD
+    rows = np.flatnonzero(ink.any(axis=1))
+    cols = np.flatnonzero(ink.any(axis=0))
+    if rows.size == 0:
+        return None
+
+    top, bottom = max(rows[0] - PADDING, 0), min(rows[-1] + PADDING + 1, alpha.shape[0])
+    left, right = max(cols[0] - PADDING, 0), min(cols[-1] + PADDING + 1, alpha.shape[1])
+    return alpha[top:bottom, left:right]
+
+
+def normalise(alpha: np.ndarray) -> Image.Image:
+    h, w = alpha.shape
+
+    rgba = np.empty((h, w, 4), dtype=np.uint8)
+    rgba[..., :3] = INK_COLOUR
+    rgba[..., 3] = alpha
+
+    img = Image.fromarray(rgba, "RGBA")
+    if h > MAX_HEIGHT:
+        img = img.resize((max(1, round(w * MAX_HEIGHT / h)), MAX_HEIGHT), Image.Resampling.LANCZOS)
+    return img
+
+
+def prepare_signature(data_url: str | None) -> Signature | None:
+    """
+    Trimmed, normalised signature from a data URL, or None if there is no ink.
+    """
+    if not data_url or "," not in data_url:
+        return None
+
+    raw = base64.b64decode(data_url.split(",", 1)[1])
+    img = decode(raw, MAX_PIXELS, mode="RGBA")
+
+    canvas_width = img.width
+    alpha = trim(ink_alpha(np.asarray(img)))
+    if alpha is None:
+        return None
+
+    ink_height, ink_width = alpha.shape
+    img = normalise(alpha)
+
+    buf = io.BytesIO()
+    img.save(buf, format="PNG", optimize=True)
+    buf.seek(0)
+
+    return Signature(ImageReader(buf), ink_width, ink_height, canvas_width)
@@ -0,0 +1,175 @@
+import configparser
+import hashlib
+import io
+import json
+import os
+import threading
+
+from pypdf import PdfReader
+
+from backend.pdf_utils.layout import compile_layout
+from backend.pdf_utils.send_mail import CONFIG_PATH, ensure_config, get_app_dir, resource_path
+
+
+# Versioned form templates.
+#
+# A template is the blank EPF form (template.pdf) plus the layout.json that
+# draws onto it. The pair bundled with the executable is version "bundled";
+# newer ones are dropped into templates/<version>/ next to config.ini and can
+# be switched to while the server is running.
+#
+# Every version is read, parsed and compiled once, then kept. Switching only
+# replaces the active reference, after the new version has loaded: a render
+# picks its template once when it starts, so renders in flight finish on the
+# version they started with.
+
+
+BUNDLED_VERSION = "bundled"
+TEMPLATES_DIR = get_app_dir() / "templates"
+
+# draw plans every layout must define
+REQUIRED_PLANS = ("form_11", "form_2_page_1", "form_2_page_2")
+
+
+class Template:
+    def __init__(self, version: str, pdf_bytes: bytes, layout: dict):
+        self.version = version
+        self.pdf_bytes = pdf_bytes
+        self.plans = compile_layout(layout)
+
+        missing = [name for name in REQUIRED_PLANS if name not in self.plans]
+        if missing:
+            raise ValueError(f"Template {version}: layout.json has no {', '.join(missing)}")
+
+        try:
+            pages = len(self.load().pages)
+        except Exception as e:
+            raise ValueError(f"Template {version}: template.pdf cannot be read ({e})") from e
+        if pages < len(REQUIRED_PLANS):
+            raise ValueError(f"Template {version}: template.pdf has {pages} pages, {len(REQUIRED_PLANS)} are needed")
+
+        h = hashlib.sha256(pdf_bytes)
+        h.update(json.dumps(layout, sort_keys=True).encode("utf-8"))
+        self.hash = h.hexdigest()
+
+        self._local = threading.local()
+
+    def load(self) -> PdfReader:
+        """
+        A new parsed copy of the template PDF.
+        Pages are cloned into each writer, so a reader can be reused across documents.
+        """
+        return PdfReader(io.BytesIO(self.pdf_bytes))
+
+    def reader(self) -> PdfReader:
+        # PdfReader is not thread-safe, so each render thread keeps its own
+        reader = getattr(self._local, "reader", None)
+        if reader is None:
+            reader = self._local.reader = self.load()
+        return reader
+
+
+def read_template(version: str, pdf_path, layout_path) -> Template:
+    with open(pdf_path, "rb") as f:
+        pdf_bytes = f.read()
+    with open(layout_path, "r", encoding="utf-8") as f:
+        layout = json.load(f)
+    return Template(version, pdf_bytes, layout)
+
+
+def read_template_setting() -> str:
+    try:
+        ensure_config()
+    except RuntimeError as e:
+        print(e)
+
+    cfg = configparser.ConfigParser()
+    cfg.read(CONFIG_PATH, encoding="utf-8")
+    return cfg.get("templates", "version", fallback=BUNDLED_VERSION).strip() or BUNDLED_VERSION
+
+
+class TemplateRegistry:
+    def __init__(self, directory):
+        self.directory = directory
+        self._loaded: dict[str, Template] = {}
+        self._active: Template | None = None
+        self._lock = threading.Lock()
+
+    def available(self) -> list[str]:
+        versions = [BUNDLED_VERSION]
+        if os.path.isdir(self.directory):
+            versions += sorted(
+                entry.name for entry in os.scandir(self.directory)
+                if entry.is_dir()
+                and os.path.isfile(os.path.join(entry.path, "template.pdf"))
+                and os.path.isfile(os.path.join(entry.path, "layout.json"))
+            )
+        return versions
+
+    def get(self, version: str) -> Template:
+        """
+        A template version, loaded on first use.
+        Raises KeyError for unknown versions and ValueError for broken ones.
+        """
+        with self._lock:
+            template = self._loaded.get(version)
+        if template is not None:
+            return template
+
+        if version == BUNDLED_VERSION:
+            template = read_template(version, resource_path("template.pdf"), resource_path("layout.json"))
+        elif version in self.available():
+            folder = os.path.join(self.directory, version)
+            template = read_template(version, os.path.join(folder, "template.pdf"), os.path.join(folder, "layout.json"))
+        else:
+            raise KeyError(version)
+
+        with self._lock:
+            return self._loaded.setdefault(version, template)
+
+    def current(self) -> Template:
+        template = self._active
+        if template is None:
+            template = self.activate(read_template_setting(), fallback=True)
+        return template
+
+    def resolve(self, version: str | None) -> Template:
+        """
+        The version a stored submission was rendered with, if it is still available,
+        otherwise the active one.
+        """
+        if version:
+            try:
+                return self.get(version)
+            except (KeyError, OSError, ValueError):
+                print(f"⚠️ Template {version} is not available, using {self.current().version}")
+        return self.current()
+
+    def activate(self, version: str, fallback: bool = False) -> Template:
+        """
+        Makes version the template of new submissions.
+        The version is fully loaded before it replaces the active one.
+        """
+        try:
+            template = self.get(version)
+        except (KeyError, OSError, ValueError) as e:
+            if not fallback:
+                raise
+            print(f"⚠️ Template {version} could not be loaded ({e!r}), using {BUNDLED_VERSION}")
+            template = self.get(BUNDLED_VERSION)
+
+        self._active = template
+        print(f"📄 Form template: {template.version}")
+        return template
+
+    def stats(self) -> dict:
+        with self._lock:
+            loaded = sorted(self._loaded)
+        return {
+            "active": self._active.version if self._active else None,
+            "loaded": loaded,
+            "available": self.available(),
+        }
+
+
+templates = TemplateRegistry(TEMPLATES_DIR)
@@ -0,0 +1,236 @@
+from collections import OrderedDict
+import hashlib
+import io
+import os
+import secrets
+import threading
+import time
+from typing import Callable
+from urllib.parse import quote
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from backend.pdf_utils.pdf_utils import first_page_pdf
+
+try:
+    import pypdfium2 as pdfium   # optional: PNG thumbnails
+except ImportError:
+    pdfium = None
+
+thumbnails_available = pdfium is not None
+
+# PDFium is not thread-safe: every call into it, from any request thread, goes through this lock
+pdfium_lock = threading.Lock()
+
+
+# Recently rendered PDFs, kept in memory so a preview can be re-opened,
+# retried or resumed without rendering (or reading from disk) again.
+#
+# A quick look at a submission only needs page 1 (Form 11), not the whole
+# document with its scans: lighter versions of an entry - a one-page PDF, a PNG
+# thumbnail - are derived from it on first request and kept alongside it.
+
+
+THUMBNAIL_WIDTH = 480                 # pixels, default
+THUMBNAIL_WIDTHS = (240, 480, 960)    # sizes rendered; a requested width is snapped to one of them
+THUMBNAIL_COLOURS = 32            # forms are mostly black text on white: a small palette is enough
+
+
+class PreviewEntry:
+    def __init__(self, data: bytes, filename: str, media_type: str = "application/pdf"):
+        self.data = data
+        self.filename = filename
+        self.media_type = media_type
+        self.etag = f'"{hashlib.sha256(data).hexdigest()[:32]}"'
+        self.created = time.time()
+        self.derived: dict[str, "PreviewEntry"] = {}
+
+    @property
+    def size(self) -> int:
+        return len(self.data) + sum(len(d.data) for d in self.derived.values())
+
+
+class PreviewCache:
+    """
+    LRU of rendered PDFs, bounded by their total size in bytes.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries: OrderedDict[str, PreviewEntry] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, data: bytes, filename: str) -> str:
+        token = secrets.token_urlsafe(16)
+        entry = PreviewEntry(data, filename)
+
+        with self._lock:
+            self._entries[token] = entry
+            self.total_bytes += len(data)
+
+            self._evict()
+
+        return token
+
+    def _evict(self):
+        # always keep the newest entry, even if it alone exceeds the budget
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            _, old = self._entries.popitem(last=False)
+            self.total_bytes -= old.size
+
+    def get(self, token: str) -> PreviewEntry | None:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None:
+                self._entries.move_to_end(token)
+            return entry
+
+    def derive(self, token: str, key: str, make: Callable[[PreviewEntry], PreviewEntry]) -> PreviewEntry | None:
+        """
+        A lighter version of an entry (see first_page / thumbnail), made once and kept with it.
+        """
+        entry = self.get(token)
+        if entry is None:
+            return None
+
+        derived = entry.derived.get(key)
+        if derived is not None:
+            return derived
+
+        derived = make(entry)   # outside the lock: renders can take a few ms
+
+        with self._lock:
+            if key in entry.derived:
+                return entry.derived[key]
+            entry.derived[key] = derived
+            if self._entries.get(token) is entry:
+                self.total_bytes += len(derived.data)
+                self._evict()
+
+        return derived
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+def first_page(entry: PreviewEntry) -> PreviewEntry:
+    name = os.path.splitext(entry.filename)[0]
+    return PreviewEntry(first_page_pdf(entry.data), f"{name}_page1.pdf")
+
+
+def thumbnail_width(requested: int) -> int:
+    """
+    The smallest rendered size at least as wide as requested (or the largest),
+    so a preview keeps at most len(THUMBNAIL_WIDTHS) thumbnails.
+    """
+    return next((w for w in THUMBNAIL_WIDTHS if w >= requested), THUMBNAIL_WIDTHS[-1])
+
+
+def thumbnail(entry: PreviewEntry, width: int) -> PreviewEntry:
+    """
+    PNG of page 1, width pixels wide. Needs pypdfium2.
+    """
+    with pdfium_lock:
+        doc = pdfium.PdfDocument(entry.data)
+        try:
+            doc.init_forms()   # draws the editable fields too
+            page = doc[0]
+            img = page.render(scale=width / page.get_width(), may_draw_forms=True).to_pil()
+        finally:
+            doc.close()
+
+    buf = io.BytesIO()
+    img.quantize(colors=THUMBNAIL_COLOURS).save(buf, format="PNG", optimize=True)
+
+    name = os.path.splitext(entry.filename)[0]
+    return PreviewEntry(buf.getvalue(), f"{name}_page1.png", media_type="image/png")
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """
+    Parses a single "bytes=start-end" range.
+    Returns (start, end) inclusive, or None if the range cannot be satisfied.
+    Raises ValueError for anything that is not a single byte range.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        raise ValueError(header)
+
+    start_s, _, end_s = spec.strip().partition("-")
+
+    if not start_s:
+        # suffix range: last N bytes
+        length = int(end_s)
+        if length <= 0:
+            return None
+        return max(0, size - length), size - 1
+
+    start = int(start_s)
+    end = int(end_s) if end_s else size - 1
+    end = min(end, size - 1)
+
+    if start > end:
+        return None
+    return start, end
+
+
+def pdf_response(
+    request: Request,
+    entry: PreviewEntry,
+    disposition: str = "inline",
+    headers: dict | None = None,
+) -> Response:
+    quoted = quote(entry.filename)
+    if quoted != entry.filename:
+        content_disposition = f"{disposition}; filename*=utf-8''{quoted}"
+    else:
+        content_disposition = f'{disposition}; filename="{entry.filename}"'
+
+    base_headers = {
+        "ETag": entry.etag,
+        "Cache-Control": "private, max-age=3600, immutable",
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": content_disposition,
+        **(headers or {}),
+    }
+
+    if request.headers.get("if-none-match") == entry.etag:
+        return Response(status_code=304, headers=base_headers)
+
+    size = len(entry.data)
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+
+    if range_header and (not if_range or if_range == entry.etag):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            byte_range = (0, size - 1)  # unsupported form, serve everything
+
+        if byte_range is None:
+            return Response(
+                status_code=416,
+                headers={**base_headers, "Content-Range": f"bytes */{size}"},
+            )
+
+        start, end = byte_range
+        if (start, end) != (0, size - 1):
+            return Response(
+                content=entry.data[start:end + 1],
+                status_code=206,
+                media_type=entry.media_type,
+                headers={**base_headers, "Content-Range": f"bytes {start}-{end}/{size}"},
+            )
+
+    return Response(
+        content=entry.data,
+        media_type=entry.media_type,
+        headers=base_headers,
+    )
@@ -0,0 +1,137 @@
+from functools import lru_cache
+import os
+import threading
+
+from backend.admission import read_limits
+from backend.atomic import publish, write_temp
+from backend.models import Payload
+from backend.pdf_utils.pdf_utils import render_forms, render_key
+from backend.pdf_utils.templates import Template
+
+
+# Finished PDFs, keyed by the content hash of everything drawn into them
+# (render_key), so re-storing an unchanged submission - a resubmission without
+# changes, a re-import of the same sheet, a bulk rebuild - skips the render entirely.
+#
+# Entries are plain files in output/.cache/pdf/<key>.pdf. A hit refreshes the
+# file's mtime, and the oldest files are evicted once the folder grows past
+# render_cache_mb. Bulk import workers share the folder: files are published
+# atomically, and the folder itself (not each process's count) decides eviction.
+
+
+CACHE_DIR = os.path.join(".cache", "pdf")
+
+
+class RenderCache:
+    """
+    LRU of rendered PDFs on disk, bounded by their total size in bytes.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.total_bytes = None   # counted on first use
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pdf")
+
+    def _scan(self) -> list[os.DirEntry]:
+        try:
+            return [e for e in os.scandir(self.directory) if e.is_file() and e.name.endswith(".pdf")]
+        except FileNotFoundError:
+            return []
+
+    def get(self, key: str) -> bytes | None:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)   # most recently used
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        publish(write_temp(self.directory, data), self._path(key))
+
+        with self._lock:
+            if self.total_bytes is None:
+                self.total_bytes = sum(e.stat().st_size for e in self._scan())
+            else:
+                self.total_bytes += len(data)
+
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # other processes write here too: the folder is the source of truth
+        entries = []
+        for e in self._scan():
+            try:
+                st = e.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, e.path))
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9   # some headroom, so not every put evicts
+
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            total -= size
+
+        self.total_bytes = total
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+@lru_cache(maxsize=None)
+def render_cache(output_dir: str) -> RenderCache | None:
+    """
+    The cache of an output folder, or None if render_cache_mb is 0.
+    """
+    max_mb = read_limits()["render_cache_mb"]
+    if not max_mb:
+        return None
+    return RenderCache(os.path.join(output_dir, CACHE_DIR), max_mb * 1024 * 1024)
+
+
+def render_cached(payload: Payload, output_dir: str | os.PathLike, template: Template) -> bytes:
+    """
+    The merged PDF of a submission, from the cache of output_dir when unchanged.
+    """
+    cache = render_cache(os.fspath(output_dir))
+    if cache is None:
+        return render_forms(payload.forms, payload.documents, template)
+
+    key = render_key(payload.forms, payload.documents, template)
+    pdf_bytes = cache.get(key)
+    if pdf_bytes is None:
+        pdf_bytes = render_forms(payload.forms, payload.documents, template)
+        cache.put(key, pdf_bytes)
+    return pdf_bytes
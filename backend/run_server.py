@@ -1,15 +1,15 @@
 # run_server.py
 import asyncio
+import multiprocessing
 import os
 import secrets
 import sys
 import webbrowser
 import uvicorn
-from backend.main import app
 import sys
 import logging
 
-# pyinstaller --onefile --add-data "../dist;dist" --add-data "./pdf_utils/template.pdf;." --add-data "./pdf_utils/overlay.pdf;." --add-data "./pdf_utils/config.template.ini;." --icon=../public/favicon.ico --version-file version.txt --name=PF_Server run_server.py
+# pyinstaller --onefile --add-data "../dist;dist" --add-data "./pdf_utils/template.pdf;." --add-data "./pdf_utils/layout.json;." --add-data "./pdf_utils/config.template.ini;." --icon=../public/favicon.ico --version-file version.txt --name=PF_Server run_server.py
 
 HAS_CONSOLE = (
     sys.stdout is not None
@@ -81,6 +81,12 @@ if sys.platform.startswith("win"):
 
 
 if __name__ == "__main__":
+    # bulk import renders in worker processes; required for the frozen exe
+    multiprocessing.freeze_support()
+
+    # imported only here: worker processes run this file too, and must not load the server
+    from backend.main import app
+
     # Open browser automatically
     
     print("Backend started")
@@ -0,0 +1,147 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+from fastapi.responses import Response
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException as StarletteHTTPException
+
+try:
+    import brotli
+except ImportError:  # optional, gzip is always available
+    brotli = None
+
+
+COMPRESSIBLE = (".js", ".css", ".html", ".svg", ".json", ".txt", ".map", ".ico", ".webmanifest")
+MIN_COMPRESS_SIZE = 1024
+
+# Vite emits hashed bundle names, e.g. assets/index-B7f3kQ2a.js
+HASHED_ASSET = re.compile(r"-[A-Za-z0-9_-]{8,}\.[a-z0-9]+$")
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+
+def accepted_encodings(scope) -> set[str]:
+    header = Headers(scope=scope).get("accept-encoding", "")
+    return {part.split(";")[0].strip().lower() for part in header.split(",") if part.strip()}
+
+
+def compress_variants(path: str, data: bytes) -> dict[str, bytes]:
+    """
+    Returns {"br": ..., "gzip": ...} for a file, preferring pre-built
+    .br / .gz siblings from the frontend build over compressing here.
+    """
+    variants = {}
+
+    for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+        if os.path.exists(path + suffix):
+            with open(path + suffix, "rb") as f:
+                variants[encoding] = f.read()
+
+    if "br" not in variants and brotli is not None:
+        variants["br"] = brotli.compress(data, quality=9)
+    if "gzip" not in variants:
+        variants["gzip"] = gzip.compress(data, compresslevel=9, mtime=0)
+
+    # not worth a Content-Encoding if it barely helps
+    return {enc: body for enc, body in variants.items() if len(body) < len(data) * 0.9}
+
+
+class CachedFile:
+    def __init__(self, path: str, data: bytes):
+        self.data = data
+        self.media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.etag = hashlib.md5(data).hexdigest()
+        self.variants = compress_variants(path, data)
+
+
+class SPAStaticFiles(StaticFiles):
+    """
+    Serves the built frontend.
+    Compressible files are compressed once at startup and kept in memory,
+    hashed assets are served as immutable, and index.html (also the SPA
+    fallback for unknown paths) is served from memory.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.files: dict[str, CachedFile] = {}
+        self.index: CachedFile | None = None
+
+        if self.directory and os.path.isdir(self.directory):
+            self.preload(str(self.directory))
+
+    def preload(self, directory: str):
+        for root, _, filenames in os.walk(directory):
+            for filename in filenames:
+                if not filename.lower().endswith(COMPRESSIBLE):
+                    continue
+
+                full_path = os.path.join(root, filename)
+                with open(full_path, "rb") as f:
+                    data = f.read()
+
+                if filename != "index.html" and len(data) < MIN_COMPRESS_SIZE:
+                    continue
+
+                rel_path = os.path.normpath(os.path.relpath(full_path, directory))
+                self.files[rel_path] = CachedFile(full_path, data)
+
+        self.index = self.files.get("index.html")
+
+    def cache_control(self, path: str) -> str:
+        if HASHED_ASSET.search(path):
+            return IMMUTABLE
+        return REVALIDATE
+
+    def cached_response(self, cached: CachedFile, scope, cache_control: str, status_code: int = 200) -> Response:
+        encoding = next((enc for enc in ("br", "gzip") if enc in cached.variants and enc in accepted_encodings(scope)), None)
+
+        etag = f'"{cached.etag}-{encoding}"' if encoding else f'"{cached.etag}"'
+        headers = {
+            "ETag": etag,
+            "Cache-Control": cache_control,
+            "Vary": "Accept-Encoding",
+        }
+
+        if status_code == 200 and Headers(scope=scope).get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+
+        if encoding:
+            headers["Content-Encoding"] = encoding
+            body = cached.variants[encoding]
+        else:
+            body = cached.data
+
+        return Response(body, status_code=status_code, media_type=cached.media_type, headers=headers)
+
+    def index_response(self, scope, status_code: int = 200) -> Response:
+        return self.cached_response(self.index, scope, REVALIDATE, status_code)
+
+    async def get_response(self, path: str, scope):
+        path = os.path.normpath(path)
+
+        if path in (".", "index.html") and self.index:
+            return self.index_response(scope)
+
+        cached = self.files.get(path)
+        if cached:
+            return self.cached_response(cached, scope, self.cache_control(path))
+
+        try:
+            response = await super().get_response(path, scope)
+        except StarletteHTTPException as ex:
+            if ex.status_code == 404:
+                if self.index:
+                    return self.index_response(scope)
+                return await super().get_response("index.html", scope)
+            raise ex
+
+        if response.status_code in (200, 304):
+            response.headers["Cache-Control"] = self.cache_control(path)
+        return response
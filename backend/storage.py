@@ -0,0 +1,387 @@
+from abc import ABC, abstractmethod
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import configparser
+from contextlib import contextmanager
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+from typing import BinaryIO, Iterator
+
+from backend.atomic import FILE_MODE, committer, publish
+from backend.pdf_utils.send_mail import CONFIG_PATH, ensure_config
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:   # only needed for backend = s3
+    boto3 = None
+
+
+# Shared storage of submissions.
+#
+# The output folder stays the working copy of this server: mails, previews, the
+# ledger and HR's edits all use it. A [storage] backend - a folder on a network
+# drive, or an S3-compatible bucket (AWS S3, MinIO, ...) - additionally receives
+# a copy of every stored submission, so several PF servers at different sites
+# share one store without copying files by hand:
+#
+#   <site>/<name>.json
+#   <site>/PDF/<name>.pdf
+#
+# Copies are made in the background after each submission, bulk import and
+# read-back of PDF fields (which replace earlier copies), and on startup for
+# anything missed while the storage was unreachable.
+#
+#   python -m backend.storage sync ./output        upload what the storage is missing
+#   python -m backend.storage excel all.xlsx       Excel summary of every site
+
+
+CHUNK_SIZE = 1024 * 1024
+SPOOL_SIZE = 8 * 1024 * 1024   # S3 uploads larger than this are buffered on disk, not in memory
+
+
+class Storage(ABC):
+    """
+    Objects by key: "/"-separated paths such as "site-a/PDF/NAME_DOB.pdf".
+    Backends implement open_read, open_write, keys and delete.
+    """
+
+    @abstractmethod
+    def open_read(self, key: str) -> BinaryIO:
+        """
+        A stream of the object. Raises FileNotFoundError if there is none.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def open_write(self, key: str):
+        """
+        Context manager giving a stream to write the object to.
+        The object is only replaced once the block completes without error.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def keys(self, prefix: str = "", recursive: bool = True) -> Iterator[str]:
+        """
+        Keys under prefix (a folder, ending in "/"), or only those directly in it.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def get(self, key: str) -> bytes:
+        with self.open_read(key) as f:
+            return f.read()
+
+    def put(self, key: str, data: bytes | str):
+        with self.open_write(key) as f:
+            f.write(data.encode("utf-8") if isinstance(data, str) else data)
+
+    def get_json(self, key: str):
+        with self.open_read(key) as f:
+            return json.load(f)
+
+    def put_json(self, key: str, value):
+        self.put(key, json.dumps(value, indent=2, default=str))
+
+    def put_file(self, key: str, path: str):
+        with open(path, "rb") as src, self.open_write(key) as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+
+class LocalStorage(Storage):
+    """
+    A folder, local or on a network drive. Writes are atomic (temp file + rename).
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        parts = key.split("/")
+        if any(part in ("", ".", "..") for part in parts):
+            raise ValueError(f"Invalid storage key: {key!r}")
+        return os.path.join(self.root, *parts)
+
+    def open_read(self, key: str) -> BinaryIO:
+        return open(self._path(key), "rb")
+
+    @contextmanager
+    def open_write(self, key: str):
+        path = self._path(key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+        try:
+            os.chmod(tmp_path, FILE_MODE)   # readable by the other sites, not mkstemp's 0600
+            with os.fdopen(fd, "wb") as f:
+                yield f
+                committer.sync(f)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        publish(tmp_path, path)
+
+    def keys(self, prefix: str = "", recursive: bool = True) -> Iterator[str]:
+        top = self._path(prefix.rstrip("/")) if prefix.strip("/") else self.root
+
+        if not recursive:
+            try:
+                entries = sorted(os.scandir(top), key=lambda e: e.name)
+            except FileNotFoundError:
+                return
+            for entry in entries:
+                if entry.is_file() and not entry.name.startswith("."):
+                    yield os.path.relpath(entry.path, self.root).replace(os.sep, "/")
+            return
+
+        for directory, dirnames, filenames in os.walk(top):
+            # caches, temp files, lock files
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+            for filename in sorted(filenames):
+                if not filename.startswith("."):
+                    yield os.path.relpath(os.path.join(directory, filename), self.root).replace(os.sep, "/")
+
+    def delete(self, key: str):
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class S3Storage(Storage):
+    """
+    A bucket of an S3-compatible object store, optionally under a key prefix.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        endpoint_url: str | None = None,
+        region: str | None = None,
+        access_key: str | None = None,
+        secret_key: str | None = None,
+    ):
+        if boto3 is None:
+            raise RuntimeError("The s3 storage backend needs boto3: pip install boto3")
+
+        self.bucket = bucket
+        self.prefix = f"{prefix.strip('/')}/" if prefix.strip("/") else ""
+        # clients are thread-safe: one for all uploads
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url or None,
+            region_name=region or None,
+            aws_access_key_id=access_key or None,
+            aws_secret_access_key=secret_key or None,
+        )
+
+    def open_read(self, key: str) -> BinaryIO:
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self.prefix + key)["Body"]
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                raise FileNotFoundError(key) from e
+            raise
+
+    @contextmanager
+    def open_write(self, key: str):
+        # uploaded once complete; large objects go up in parts (upload_fileobj)
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as f:
+            yield f
+            f.seek(0)
+            self.client.upload_fileobj(f, self.bucket, self.prefix + key)
+
+    def keys(self, prefix: str = "", recursive: bool = True) -> Iterator[str]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        # with a delimiter, deeper keys are folded into CommonPrefixes and skipped
+        options = {} if recursive else {"Delimiter": "/"}
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix + prefix, **options):
+            for obj in page.get("Contents", []):
+                yield obj["Key"][len(self.prefix):]
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+
+
+#                                                                                --- CONFIG ---
+
+def read_storage_settings() -> dict:
+    try:
+        ensure_config()
+    except RuntimeError as e:
+        print(e)
+
+    cfg = configparser.ConfigParser()
+    cfg.read(CONFIG_PATH, encoding="utf-8")
+
+    def get(option: str, fallback: str = "") -> str:
+        return cfg.get("storage", option, fallback=fallback).strip()
+
+    return {
+        "backend": get("backend", "none").lower(),
+        "site": get("site") or socket.gethostname(),
+        "path": get("path"),
+        "bucket": get("bucket"),
+        "prefix": get("prefix"),
+        "endpoint_url": get("endpoint_url"),
+        "region": get("region"),
+        "access_key": get("access_key"),
+        "secret_key": get("secret_key"),
+    }
+
+
+def open_storage(settings: dict) -> Storage | None:
+    """
+    The configured shared storage, or None if there is none.
+    Raises ValueError / RuntimeError if it is set up wrong.
+    """
+    backend = settings["backend"]
+    if backend in ("", "none"):
+        return None
+    if backend == "folder":
+        if not settings["path"]:
+            raise ValueError("[storage] backend = folder needs a path")
+        return LocalStorage(settings["path"])
+    if backend == "s3":
+        if not settings["bucket"]:
+            raise ValueError("[storage] backend = s3 needs a bucket")
+        return S3Storage(
+            settings["bucket"],
+            prefix=settings["prefix"],
+            endpoint_url=settings["endpoint_url"],
+            region=settings["region"],
+            access_key=settings["access_key"],
+            secret_key=settings["secret_key"],
+        )
+    raise ValueError(f"[storage] backend must be none, folder or s3, not {backend!r}")
+
+
+#                                                                                --- REPLICATION ---
+
+class Replicator:
+    """
+    Copies the submissions of an output folder to shared storage, under the site's name.
+    """
+
+    def __init__(self, storage: Storage, site: str, output_dir: str, workers: int = 2):
+        self.storage = storage
+        self.site = site
+        self.output_dir = output_dir
+
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="storage")
+        self._lock = threading.Lock()
+        self.uploaded = 0
+        self.failed = 0
+        self.last_error: str | None = None
+
+    def _files(self, name: str) -> list[tuple[str, str]]:
+        return [
+            (f"{self.site}/{name}.json", os.path.join(self.output_dir, f"{name}.json")),
+            (f"{self.site}/PDF/{name}.pdf", os.path.join(self.output_dir, "PDF", f"{name}.pdf")),
+        ]
+
+    def _upload(self, name: str) -> bool:
+        try:
+            # PDF first, as in the output folder: a JSON in the storage always has its PDF
+            for key, path in reversed(self._files(name)):
+                self.storage.put_file(key, path)
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+                self.last_error = f"{name}: {type(e).__name__}: {e}"
+            print(f"⚠️ Could not copy {name} to shared storage: {e}")
+            return False
+
+        with self._lock:
+            self.uploaded += 1
+        return True
+
+    def upload(self, name: str):
+        """
+        Copies one stored submission in the background.
+        """
+        self._pool.submit(self._upload, name)
+
+    def sync(self, everything: bool = False) -> dict:
+        """
+        Uploads every submission of the output folder that the storage is missing
+        (or all of them). Blocks until done.
+        """
+        present = set() if everything else set(self.storage.keys(f"{self.site}/"))
+        names = [
+            filename[:-5] for filename in sorted(os.listdir(self.output_dir))
+            if filename.lower().endswith(".json")
+            and any(key not in present for key, _ in self._files(filename[:-5]))
+        ]
+
+        results = list(self._pool.map(self._upload, names))
+        return {"uploaded": results.count(True), "failed": results.count(False)}
+
+    def start(self):
+        """
+        Catches up on submissions missed while the storage was unreachable, in the background.
+        """
+        def catch_up():
+            try:
+                result = self.sync()
+            except Exception as e:
+                print(f"⚠️ Shared storage not reachable: {e}")
+                return
+            if result["uploaded"] or result["failed"]:
+                print(f"📦 Shared storage: {result['uploaded']} submissions copied, {result['failed']} failed")
+
+        threading.Thread(target=catch_up, name="storage-sync", daemon=True).start()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "site": self.site,
+                "uploaded": self.uploaded,
+                "failed": self.failed,
+                "last_error": self.last_error,
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared storage of submissions, see [storage] in config.ini")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    sync = commands.add_parser("sync", help="upload the submissions the storage is missing")
+    sync.add_argument("output_dir", help="output folder (containing the JSON files and PDF/)")
+    sync.add_argument("--all", action="store_true", help="upload every submission again")
+
+    excel = commands.add_parser("excel", help="Excel summary of the submissions in the storage")
+    excel.add_argument("output_file")
+    excel.add_argument("--site", default="", help="only this site")
+
+    args = parser.parse_args()
+
+    settings = read_storage_settings()
+    storage = open_storage(settings)
+    if storage is None:
+        parser.error("no shared storage set up: set backend in the [storage] section of config.ini")
+
+    if args.command == "sync":
+        result = Replicator(storage, settings["site"], args.output_dir).sync(everything=args.all)
+        print(f"✅ {result['uploaded']} submissions copied, {result['failed']} failed")
+    else:
+        from backend.json_to_excel import combine_storage_to_excel
+
+        if args.site:
+            combine_storage_to_excel(storage, args.output_file, f"{args.site}/", recursive=False)
+        else:
+            combine_storage_to_excel(storage, args.output_file)   # <site>/<name>.json of every site
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+from contextlib import contextmanager
+import json
+import os
+import threading
+import time
+
+from backend.atomic import FileLock, publish, write_temp
+from backend.intake import intake_documents
+from backend.models import Payload
+from backend.ledger import append_row
+from backend.pdf_utils.pdf_utils import form2_to_tsv
+from backend.pdf_utils.templates import templates
+from backend.render_cache import render_cached
+
+
+# Persisting one submission: document intake, ledger row, JSON (source of truth) and the merged PDF.
+# Shared by the submission endpoint and the bulk importer.
+#
+# Nothing is written until the PDF has rendered. Both files then go to temp files
+# and are renamed into place under a name claimed atomically: a resubmission of the
+# same person (same Aadhaar) replaces their earlier files, anyone else sharing the
+# name and date of birth gets NAME_DOB_2, NAME_DOB_3, ...
+
+
+_names_lock = threading.Lock()
+
+
+@contextmanager
+def names_lock(output_dir: str):
+    # the lock file is shared with the bulk import worker processes
+    with _names_lock, FileLock(os.path.join(output_dir, ".names.lock")):
+        yield
+
+
+def submission_names(payload: Payload) -> dict:
+    f11 = payload.forms.form_11
+
+    member_name = f11.personal_details.member_name
+    uan = (f11.previous_employment.uan if f11.previous_employment else None) or ""
+    dob = f11.personal_details.date_of_birth
+
+    # Sanitize filename
+    safe_name = "".join(c for c in member_name if c.isalnum() or c in (' ', '-', '_')).strip().upper()
+    safe_uan = "".join(c for c in uan if c.isalnum()).strip()
+    safe_dob = "".join(c for c in str(dob))
+
+    return {
+        "safe_name": safe_name,
+        "safe_uan": safe_uan,
+        "base_filename": f"{safe_name}_{safe_dob}" if safe_dob else safe_name,
+    }
+
+
+def stored_aadhaar(json_path: str) -> str | None:
+    try:
+        with open(json_path, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+        return stored["forms"]["form_11"]["kyc_details"]["aadhaar_no"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def claim_name(output_dir: str, base_filename: str, aadhaar: str) -> str:
+    """
+    First name that is free or already belongs to this person.
+    Must be called with names_lock held.
+    """
+    candidate, n = base_filename, 1
+    while True:
+        json_path = os.path.join(output_dir, f"{candidate}.json")
+        if not os.path.exists(json_path) or stored_aadhaar(json_path) == aadhaar:
+            return candidate
+
+        n += 1
+        candidate = f"{base_filename}_{n}"
+
+
+def store_submission(payload: Payload, output_dir: str) -> dict:
+    """
+    Writes the JSON and PDF of a submission into output_dir
+    and appends the TSV row to the ledger of the day.
+    Returns the sanitized names, the PDF path, the rendered PDF bytes and the render time.
+    """
+    names = submission_names(payload)
+
+    # Compress / scan-filter the uploaded documents, if enabled in [documents]
+    payload = payload.model_copy(update={"documents": intake_documents(payload.documents)})
+
+    # Ensure output folders exist
+    pdf_dir = os.path.join(output_dir, "PDF")
+    os.makedirs(pdf_dir, exist_ok=True)
+
+    # Regenerations keep the template version they were first rendered with
+    template = templates.resolve(payload.meta.template_version)
+    payload = payload.model_copy(update={"meta": payload.meta.model_copy(update={"template_version": template.version})})
+
+    # Generate PDF (or reuse it, if nothing drawn into it changed)
+    started = time.perf_counter()
+    pdf_bytes = render_cached(payload, output_dir, template)
+    render_ms = (time.perf_counter() - started) * 1000
+
+    json_tmp = write_temp(output_dir, json.dumps(payload.model_dump(), indent=2, default=str))
+    try:
+        pdf_tmp = write_temp(pdf_dir, pdf_bytes)
+    except BaseException:
+        os.unlink(json_tmp)
+        raise
+
+    with names_lock(output_dir):
+        aadhaar = payload.forms.form_11.kyc_details.aadhaar_no
+        base_filename = claim_name(output_dir, names["base_filename"], aadhaar)
+
+        json_path = os.path.join(output_dir, f"{base_filename}.json")
+        pdf_path = os.path.join(pdf_dir, f"{base_filename}.pdf")
+
+        # PDF first: a JSON on disk always has its PDF
+        publish(pdf_tmp, pdf_path)
+        publish(json_tmp, json_path)
+
+    # Append to the TSV ledger only once the PDF exists, so failed renders leave no row
+    append_row(output_dir, form2_to_tsv(payload.forms))
+
+    return {
+        **names,
+        "base_filename": base_filename,
+        "json_path": json_path,
+        "pdf_path": pdf_path,
+        "pdf_bytes": pdf_bytes,
+        "render_ms": render_ms,
+    }
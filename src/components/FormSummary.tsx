@@ -161,7 +161,14 @@ export const FormSummary: React.FC<FormSummaryProps> = ({
     try {
       const res = await fetch(`${apiUrl}/api/forms/process`, {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: {
+          "Content-Type": "application/json",
+          // lets the server reject a wrong password before reading the body
+          // (header values must be plain ASCII, otherwise the body password is used)
+          ...(/^[\x20-\x7E]*$/.test(submissionPassword)
+            ? { "X-Submission-Password": submissionPassword }
+            : {}),
+        },
         body: JSON.stringify(payload),
       });
 
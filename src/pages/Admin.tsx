@@ -6,9 +6,44 @@ import { Input } from "@/components/ui/input";
 import { toast } from "@/hooks/use-toast";
 import NotFound from "./NotFound";
 // const API = "http://localhost:8000";
-import { QRCodeCanvas } from "qrcode.react";
 
 const API = "";
+
+// Server events pushed over the heartbeat socket ("event:<json>")
+type QueueDepth = { rendering: number; mail_pending: number; mail_dead: number };
+type ServerEvent = {
+  type: string;
+  time: number;
+  queue?: QueueDepth;
+  name?: string;
+  names?: string[];
+  ms?: number;
+  error?: string;
+  dead?: boolean;
+  ip?: string;
+};
+
+const THROUGHPUT_WINDOW = 10 * 60; // seconds
+
+function describeEvent(ev: ServerEvent) {
+  switch (ev.type) {
+    case "submission":
+      return `Received ${ev.name}`;
+    case "rendered":
+      return `PDF of ${ev.name} in ${ev.ms} ms`;
+    case "render_failed":
+      return `PDF of ${ev.name} failed: ${ev.error}`;
+    case "mail_sent":
+      return `Mailed ${ev.names?.join(", ")}`;
+    case "mail_failed":
+      return `Mail for ${ev.name} ${ev.dead ? "failed" : "will retry"}: ${ev.error}`;
+    case "lan_changed":
+      return `Now serving at ${ev.ip}`;
+    default:
+      return ev.type;
+  }
+}
+
 function Admin() {
   const [showPassword, setShowPassword] = useState(false);
   const [showCurrPass, setShowCurrPass] = useState(false);
@@ -19,18 +54,42 @@ function Admin() {
   const [secondsLeft, setSecondsLeft] = useState<number | null>(null);
   const [confirmKill, setConfirmKill] = useState(false);
   const [isAdmin, setIsAdmin] = useState(false);
+  const [events, setEvents] = useState<ServerEvent[]>([]);
+  const [queue, setQueue] = useState<QueueDepth | null>(null);
 
   useEffect(() => {
-    let ws;
+    let ws: WebSocket;
+    let pingTimer: ReturnType<typeof setInterval> | undefined;
+    let lastRtt: number | null = null;
 
     function connectWS() {
       ws = new WebSocket(`/ws/heartbeat`);
 
       ws.onopen = () => {
         console.log("🟢 WS connected");
+
+        // Keep the server's per-connection deadline fresh and report the last round trip
+        pingTimer = setInterval(() => {
+          const rtt = lastRtt !== null ? `:${lastRtt.toFixed(1)}` : "";
+          ws.send(`ping:${performance.now()}${rtt}`);
+        }, 5000);
+      };
+
+      ws.onmessage = (e) => {
+        if (typeof e.data !== "string") return;
+
+        if (e.data.startsWith("pong:")) {
+          lastRtt = performance.now() - Number(e.data.slice(5));
+        } else if (e.data.startsWith("event:")) {
+          const ev: ServerEvent = JSON.parse(e.data.slice(6));
+          if (ev.queue) setQueue(ev.queue);
+          if (ev.type === "lan_changed" && ev.ip) setErrors2((prev) => ({ ...prev, ip: ev.ip }));
+          if (ev.type !== "snapshot") setEvents((prev) => [ev, ...prev].slice(0, 100));
+        }
       };
 
       ws.onclose = () => {
+        clearInterval(pingTimer);
         console.log("🔴 WS closed");
       };
     }
@@ -38,6 +97,11 @@ function Admin() {
     connectWS();
 
     document.title = "EPF • Admin ";
+
+    return () => {
+      clearInterval(pingTimer);
+      ws.close();
+    };
   }, []);
 
   // Kill timer
@@ -238,6 +302,16 @@ function Admin() {
     }
   }
 
+  // Live throughput, from the events received
+  const recent = events.filter((ev) => ev.time > Date.now() / 1000 - THROUGHPUT_WINDOW);
+  const rendered = recent.filter((ev) => ev.type === "rendered");
+  const avgRenderMs = rendered.length
+    ? Math.round(rendered.reduce((sum, ev) => sum + (ev.ms ?? 0), 0) / rendered.length)
+    : null;
+  const mailed = recent
+    .filter((ev) => ev.type === "mail_sent")
+    .reduce((sum, ev) => sum + (ev.names?.length ?? 0), 0);
+
   if (!isAdmin) return <NotFound />;
 
   return (
@@ -247,10 +321,13 @@ function Admin() {
         space-y-10 items-center w-[25vw] min-w-[350px] sm:min-w-[478px] min-h-[60vh] pt-10 pb-10"
       >
         {errors2.ip && (
-          <QRCodeCanvas
+          // rendered once by the server, works without internet access
+          <img
             className="qr transition-transform"
-            value={`http://${errors2.ip}`}
-            size={200}
+            src={`${API}/api/qr.png?for=${encodeURIComponent(errors2.ip)}`}
+            alt={`http://${errors2.ip}`}
+            width={200}
+            height={200}
           />
         )}
 
@@ -435,6 +512,30 @@ function Admin() {
             Not authorized to terminate
           </span>
         </div>
+
+        {/* Live activity */}
+        {queue && (
+          <div className="w-full text-xs text-muted-foreground/70 border border-input rounded-md px-4 py-3 space-y-2">
+            <div className="flex justify-between">
+              <span>rendering {queue.rendering}</span>
+              <span>mail queue {queue.mail_pending}</span>
+              <span className={queue.mail_dead ? "text-red-500/70" : ""}>mail failed {queue.mail_dead}</span>
+            </div>
+            <div className="flex justify-between">
+              <span>{rendered.length} PDFs / 10 min</span>
+              <span>{avgRenderMs !== null ? `avg ${avgRenderMs} ms` : "–"}</span>
+              <span>{mailed} mailed</span>
+            </div>
+            {events.slice(0, 5).map((ev, i) => (
+              <div
+                key={`${ev.time}-${i}`}
+                className={`truncate ${ev.type.endsWith("failed") ? "text-red-500/70" : ""}`}
+              >
+                {new Date(ev.time * 1000).toLocaleTimeString()} · {describeEvent(ev)}
+              </div>
+            ))}
+          </div>
+        )}
       </div>
     </div>
   );
@@ -0,0 +1,203 @@
+import smtplib
+import time
+
+import pytest
+
+import backend.outbox as outbox_module
+from backend.outbox import RETRY_BASE, MailOutbox
+
+
+CFG = {
+    "email": "sender@example.com",
+    "to_mail": "hr@example.com",
+    "subject": "PF",
+    "body": "Attached PF doc.\n01/01/2026",
+    "smtp_host": "localhost",
+    "smtp_port": 25,
+    "password": "secret",
+}
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    """
+    Messages handed to deliver(); set sent.error to make deliveries fail.
+    """
+    class Deliveries(list):
+        error = None
+
+    deliveries = Deliveries()
+
+    def deliver(cfg, msg):
+        if deliveries.error is not None:
+            raise deliveries.error
+        deliveries.append(msg)
+
+    monkeypatch.setattr(outbox_module, "mail_settings", lambda: CFG)
+    monkeypatch.setattr(outbox_module, "deliver", deliver)
+    return deliveries
+
+
+def make_outbox(tmp_path, **kwargs) -> MailOutbox:
+    return MailOutbox(str(tmp_path / "outbox.sqlite3"), **kwargs)
+
+
+def make_pdf(tmp_path, name: str, size: int = 1000) -> str:
+    pdf_dir = tmp_path / "PDF"
+    pdf_dir.mkdir(exist_ok=True)
+    path = pdf_dir / f"{name}.pdf"
+    path.write_bytes(b"%PDF" + b"x" * (size - 4))
+    return str(path)
+
+
+def send_due(outbox: MailOutbox) -> list:
+    """
+    One round of the delivery thread, without the thread: claim a batch and send it.
+    """
+    batch = outbox._claim()
+    if batch:
+        outbox._inflight += 1
+        outbox._send(batch)
+    return batch
+
+
+def row(outbox: MailOutbox, mail_id: int) -> dict:
+    return dict(outbox._execute("SELECT * FROM mails WHERE id = ?", (mail_id,))[0])
+
+
+def make_due(outbox: MailOutbox, mail_id: int):
+    outbox._execute("UPDATE mails SET next_attempt_at = ? WHERE id = ?", (time.time(), mail_id))
+
+
+def test_sends_a_queued_mail(tmp_path, sent):
+    outbox = make_outbox(tmp_path)
+    mail_id = outbox.enqueue("EMPLOYEE", "100", make_pdf(tmp_path, "EMPLOYEE"))
+
+    assert send_due(outbox)
+    assert len(sent) == 1
+    assert row(outbox, mail_id)["status"] == "sent"
+
+
+def test_backoff_until_max_attempts_then_dead(tmp_path, sent):
+    sent.error = smtplib.SMTPServerDisconnected("connection lost")
+    outbox = make_outbox(tmp_path, max_attempts=4)
+    mail_id = outbox.enqueue("EMPLOYEE", "100", make_pdf(tmp_path, "EMPLOYEE"))
+
+    for attempt in range(1, 4):
+        before = time.time()
+        assert send_due(outbox)
+
+        mail = row(outbox, mail_id)
+        assert mail["status"] == "pending"
+        assert mail["attempts"] == attempt
+
+        # jittered between half and all of the doubled delay
+        delay = RETRY_BASE * 2 ** (attempt - 1)
+        assert before + delay / 2 - 1 <= mail["next_attempt_at"] <= time.time() + delay
+
+        # not retried before it is due
+        assert send_due(outbox) == []
+        make_due(outbox, mail_id)
+
+    assert send_due(outbox)
+    mail = row(outbox, mail_id)
+    assert mail["status"] == "dead"
+    assert mail["attempts"] == 4
+    assert "SMTPServerDisconnected" in mail["last_error"]
+    assert sent == []
+
+
+def test_permanent_error_is_dead_at_once(tmp_path, sent):
+    sent.error = smtplib.SMTPAuthenticationError(535, b"bad credentials")
+    outbox = make_outbox(tmp_path, max_attempts=6)
+    mail_id = outbox.enqueue("EMPLOYEE", "100", make_pdf(tmp_path, "EMPLOYEE"))
+
+    send_due(outbox)
+
+    mail = row(outbox, mail_id)
+    assert mail["status"] == "dead"
+    assert mail["attempts"] == 1
+
+
+def test_missing_pdf_is_dead_at_once(tmp_path, sent):
+    outbox = make_outbox(tmp_path)
+    mail_id = outbox.enqueue("EMPLOYEE", "100", str(tmp_path / "PDF" / "gone.pdf"))
+
+    send_due(outbox)
+
+    assert row(outbox, mail_id)["status"] == "dead"
+
+
+def test_retry_requeues_a_dead_mail(tmp_path, sent):
+    sent.error = smtplib.SMTPAuthenticationError(535, b"bad credentials")
+    outbox = make_outbox(tmp_path)
+    mail_id = outbox.enqueue("EMPLOYEE", "100", make_pdf(tmp_path, "EMPLOYEE"))
+    send_due(outbox)
+
+    sent.error = None
+    assert outbox.retry(mail_id)
+    assert row(outbox, mail_id)["attempts"] == 0
+
+    send_due(outbox)
+    assert row(outbox, mail_id)["status"] == "sent"
+    assert not outbox.retry(mail_id)   # only dead mails
+
+
+def test_digest_waits_for_its_window(tmp_path, sent):
+    outbox = make_outbox(tmp_path, digest_minutes=60, digest_max_mb=1)
+    outbox.enqueue("A", "1", make_pdf(tmp_path, "A"))
+    outbox.enqueue("B", "2", make_pdf(tmp_path, "B"))
+
+    assert send_due(outbox) == []
+
+    # the oldest mail has waited long enough: everything due goes out together
+    outbox._execute("UPDATE mails SET created_at = created_at - 3600")
+    assert len(send_due(outbox)) == 2
+    assert len(sent) == 1
+    assert len(list(sent[0].iter_attachments())) == 2
+    assert outbox.counts() == {"sent": 2}
+
+
+def test_digest_size_cap_splits_the_batch(tmp_path, sent):
+    outbox = make_outbox(tmp_path, digest_minutes=60, digest_max_mb=1)
+    for name in ("A", "B", "C"):
+        outbox.enqueue(name, name, make_pdf(tmp_path, name, size=400 * 1024))
+
+    # 1.2 MB queued: the first 800 KB go now, before the window has passed
+    batch = send_due(outbox)
+    assert [mail["name"] for mail in batch] == ["A", "B"]
+    assert len(list(sent[0].iter_attachments())) == 2
+
+    # the rest waits for the next digest
+    assert send_due(outbox) == []
+    assert outbox.counts() == {"pending": 1, "sent": 2}
+
+
+def test_flush_sends_the_waiting_digest(tmp_path, sent):
+    outbox = make_outbox(tmp_path, digest_minutes=60, digest_max_mb=20)
+    outbox.enqueue("A", "1", make_pdf(tmp_path, "A"))
+    assert send_due(outbox) == []
+
+    outbox.flush()
+    assert len(send_due(outbox)) == 1
+    assert outbox.counts() == {"sent": 1}
+
+    # the flush is used up once nothing is left
+    assert send_due(outbox) == []
+    assert outbox._flush is False
+
+
+def test_start_requeues_mails_interrupted_mid_send(tmp_path, sent):
+    outbox = make_outbox(tmp_path)
+    mail_id = outbox.enqueue("EMPLOYEE", "100", make_pdf(tmp_path, "EMPLOYEE"))
+    # a previous run was killed while sending it
+    outbox._execute("UPDATE mails SET status = 'sending' WHERE id = ?", (mail_id,))
+    assert send_due(outbox) == []
+
+    outbox.start()
+    deadline = time.time() + 5
+    while row(outbox, mail_id)["status"] != "sent" and time.time() < deadline:
+        time.sleep(0.05)
+
+    assert row(outbox, mail_id)["status"] == "sent"
+    assert len(sent) == 1
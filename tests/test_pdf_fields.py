@@ -0,0 +1,38 @@
+from backend.pdf_fields import apply_fields
+
+
+def stored_submission(employee_no="111"):
+    return {"forms": {"form_2": {"employee_no": employee_no, "pf_account_no": None}, "form_11": {}}}
+
+
+def test_edit_of_one_copy_wins_over_untouched_copy():
+    stored = stored_submission()
+
+    assert apply_fields(stored, {"emp_no": "111", "employee_number": "999"})
+    assert stored["forms"]["form_2"]["employee_no"] == "999"
+
+
+def test_repeated_sync_keeps_the_correction():
+    stored = stored_submission()
+    values = {"emp_no": "111", "employee_number": "999"}
+
+    apply_fields(stored, values)
+    # the PDF is saved again without changes: the untouched copy must not revert the edit
+    assert not apply_fields(stored, dict(values))
+    assert stored["forms"]["form_2"]["employee_no"] == "999"
+
+
+def test_later_edit_of_the_other_copy_applies():
+    stored = stored_submission()
+
+    apply_fields(stored, {"emp_no": "111", "employee_number": "999"})
+    assert apply_fields(stored, {"emp_no": "555", "employee_number": "999"})
+    assert stored["forms"]["form_2"]["employee_no"] == "555"
+
+
+def test_unchanged_fields_change_nothing():
+    stored = stored_submission()
+
+    apply_fields(stored, {"emp_no": "111", "employee_number": "111"})
+    assert stored["forms"]["form_2"]["employee_no"] == "111"
+    assert not apply_fields(stored, {"emp_no": "111", "employee_number": "111"})